@@ -6,122 +6,192 @@ import shutil
 import subprocess
 import sys
 from argparse import ArgumentParser
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
-from hashlib import sha256
+from dataclasses import dataclass
+from hashlib import blake2b, sha256
 from pathlib import Path
-from typing import Any, Iterable
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterable
 
 ROOT = Path(__file__).resolve().parents[1]
 
 DEV_CACHE = Path("dev/.cache")
 
+# nothing in here modifies the environment, so it only needs to be copied once
+BASE_ENV = dict(os.environ)
 
-def walk_tree(path: Path) -> Iterable[Path]:
-    for dirname, _, filenames in os.walk(path):
-        yield Path(dirname)
-        for filename in filenames:
-            yield Path(dirname) / filename
+
+def walk_tree(path: str | Path) -> Iterable[os.DirEntry[str]]:
+    with os.scandir(path) as entries:
+        for entry in entries:
+            yield entry
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_tree(entry.path)
 
 
 def walk_modules(root: Path) -> list[Path]:
-    if root.is_file() and root.suffix == ".py":
+    if root.is_file():
+        return [root] if root.suffix == ".py" else []
+
+    try:
+        with os.scandir(root) as entries_iter:
+            entries = list(entries_iter)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+    # a package is checked as a whole, so there is no need to descend into it
+    if any(entry.name == "__init__.py" for entry in entries):
         return [root]
-    if root.is_dir():
-        if (root / "__init__.py").exists():
-            return [root]
 
-        tmp: list[Path] = []
-        for child in root.iterdir():
-            tmp.extend(walk_modules(child))
-        return tmp
+    tmp: list[Path] = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            tmp.extend(walk_modules(Path(entry.path)))
+        elif entry.is_file() and entry.name.endswith(".py"):
+            tmp.append(Path(entry.path))
+    return tmp
 
-    return []
 
+@dataclass
+class CmdResult:
+    args: list[str]
+    returncode: int
+    # combined stdout/stderr of hidden commands, spooled to disk if it gets large
+    output: IO[str] | None
 
-def cmd(*args: str | Path, hidden: bool = True, expect_fail: str | None = None, env: dict[str, str] | None = None):
-    cmd_args = [str(arg) for arg in args]
+    @property
+    def stdout(self) -> str:
+        if self.output is None:
+            return ""
+        self.output.seek(0)
+        return self.output.read()
+
+    def __enter__(self) -> "CmdResult":
+        return self
+
+    def __exit__(self, *_: object):
+        # NB: closing also deletes the temporary file, if the output got spooled to disk
+        if self.output is not None:
+            self.output.close()
 
-    print(f"* {shlex.join(cmd_args)}")
+
+def run_cmd(*args: str | Path, hidden: bool = True, env: dict[str, str] | None = None) -> CmdResult:
+    cmd_args = [str(arg) for arg in args]
 
     if env is not None:
-        env = {**os.environ.copy(), **env}
+        env = BASE_ENV | env
 
     if hidden:
-        out = subprocess.run(
-            cmd_args,
-            check=False,
-            encoding="utf-8",
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-    else:
-        out = subprocess.run(
-            cmd_args,
-            check=False,
-            encoding="utf-8",
-            env=env,
-        )
-
-    if expect_fail is None:
-        if out.returncode != 0:
-            if hidden:
+        # Tools like pytest can produce a lot of output, which we only need to
+        # look at if something failed, so avoid keeping all of it in memory.
+        # pylint: disable-next=consider-using-with
+        output = SpooledTemporaryFile(max_size=1 << 20, mode="w+", encoding="utf-8")
+        try:
+            with subprocess.Popen(
+                cmd_args,
+                encoding="utf-8",
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            ) as proc:
+                assert proc.stdout is not None
+                copyfileobj(proc.stdout, output)
+        except BaseException:
+            output.close()
+            raise
+        return CmdResult(cmd_args, proc.returncode, output)
+
+    out = subprocess.run(
+        cmd_args,
+        check=False,
+        encoding="utf-8",
+        env=env,
+    )
+    return CmdResult(cmd_args, out.returncode, None)
+
+
+def check_cmd(out: CmdResult, hidden: bool = True, expect_fail: str | None = None):
+    # the output is only needed for the check, so it gets closed afterwards
+    with out:
+        if expect_fail is None:
+            if out.returncode != 0:
+                if hidden:
+                    print(out.stdout)
+                sys.exit(out.returncode)
+        else:
+            assert hidden
+            if out.returncode == 0:
+                print("! CMD did not fail")
                 print(out.stdout)
-            sys.exit(out.returncode)
-    else:
-        assert hidden
-        if out.returncode == 0:
-            print("! CMD did not fail")
-            print(out.stdout)
-            sys.exit(1)
-        if expect_fail not in out.stdout:
-            print(f"! CMD output did not contain {expect_fail}")
-            print(out.stdout)
-            sys.exit(1)
+                sys.exit(1)
+            if expect_fail not in out.stdout:
+                print(f"! CMD output did not contain {expect_fail}")
+                print(out.stdout)
+                sys.exit(1)
+
+
+def cmd(*args: str | Path, hidden: bool = True, expect_fail: str | None = None, env: dict[str, str] | None = None):
+    print(f"* {shlex.join(str(arg) for arg in args)}")
+
+    out = run_cmd(*args, hidden=hidden, env=env)
+    check_cmd(out, hidden=hidden, expect_fail=expect_fail)
 
 
 WHICH_MODE = os.F_OK | os.X_OK
 
 
+def find_executables(dirname: Path, names: frozenset[str]) -> list[str]:
+    try:
+        with os.scandir(dirname) as entries:
+            return sorted(
+                entry.name
+                for entry in entries
+                if entry.name in names and not entry.is_dir() and os.access(entry.path, WHICH_MODE)
+            )
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
 def hide_path(executables: list[str]) -> str:
-    env_path_raw_list = os.environ["PATH"].split(":")
+    env_path_list = [Path(env_path_raw) for env_path_raw in BASE_ENV["PATH"].split(":")]
+    executable_names = frozenset(executables)
 
-    new_env_path_list_raw: list[str] = []
-    for env_path_raw in env_path_raw_list:
-        env_path = Path(env_path_raw)
+    def hide_in(env_path: Path) -> Path:
+        found_names = find_executables(env_path, executable_names)
+        if not found_names:
+            return env_path
 
-        found_names: list[str] = []
-        for executable in sorted(executables):
-            path_raw = shutil.which(executable, mode=WHICH_MODE, path=env_path_raw)
-            if path_raw:
-                path = Path(path_raw)
-                if path.parent == env_path:
-                    found_names.append(path.name)
+        key = f"{env_path}, {found_names}"
+        key = sha256(key.encode()).hexdigest()[:16]
 
-        if found_names:
-            key = f"{env_path}, {found_names}"
-            key = sha256(key.encode()).hexdigest()[:16]
+        path_cache = (DEV_CACHE / f"PATH-{key}").resolve()
 
-            path_cache = (DEV_CACHE / f"PATH-{key}").resolve()
+        if not path_cache.exists():
+            path_cache.mkdir()
+            for entry in env_path.iterdir():
+                if entry.name in found_names:
+                    continue
 
-            if not path_cache.exists():
-                path_cache.mkdir()
-                for entry in env_path.iterdir():
-                    if entry.name in found_names:
-                        continue
+                if os.access(entry, WHICH_MODE):
+                    (path_cache / entry.name).symlink_to(entry)
 
-                    if os.access(entry, WHICH_MODE):
-                        (path_cache / entry.name).symlink_to(entry)
+        assert path_cache.is_dir()
+        return path_cache
 
-            assert path_cache.is_dir()
-            env_path = path_cache
+    # each distinct PATH entry gets its own cache directory, so they can be built concurrently
+    unique_env_paths = list(dict.fromkeys(env_path_list))
+    with ThreadPoolExecutor() as executor:
+        hidden_paths = dict(zip(unique_env_paths, executor.map(hide_in, unique_env_paths)))
 
-        new_env_path_list_raw.append(str(env_path))
+    new_env_path_list_raw = [str(hidden_paths[env_path]) for env_path in env_path_list]
 
     final_path = ":".join(new_env_path_list_raw)
 
-    for executable in sorted(executables):
-        assert shutil.which(executable, mode=WHICH_MODE, path=final_path) is None
+    # make sure none of the executables can be found anymore
+    for env_path_raw in new_env_path_list_raw:
+        assert not find_executables(Path(env_path_raw), executable_names)
 
     return final_path
 
@@ -145,8 +215,21 @@ def check_style(verbose: bool):
     print()
 
     print("[Check types and lints]")
-    cmd("pyright", *verbose_arg, *paths)
-    cmd("pylint", *verbose_arg, *paths)
+    # isort and black rewrite files, so they run one after the other above.
+    # The linters only read them, so they can run side by side.
+    lint_cmds: list[list[str]] = [
+        ["pyright", *verbose_arg, *paths],
+        ["pylint", *verbose_arg, *paths],
+    ]
+
+    def run_lint(args: list[str]) -> CmdResult:
+        return run_cmd(*args)
+
+    with ThreadPoolExecutor(max_workers=len(lint_cmds)) as executor:
+        results = list(executor.map(run_lint, lint_cmds))
+    for result in results:
+        print(f"* {shlex.join(result.args)}")
+        check_cmd(result)
     print()
 
 
@@ -159,9 +242,8 @@ def check_doc():
 
 
 @contextmanager
-def cli_venv(extras: list[str], hidden_executables: list[str]):
+def cli_venv(venv_bin: Path, extras: list[str], hidden_executables: list[str]):
     print(f"[Test CLI with extras {extras}]")
-    venv_bin = dubstub_venv("3.10", extras)
     # hide all executables provided by extras
     hidden_paths = hide_path(sorted(set(["dubstub", *hidden_executables])))
     env = {
@@ -172,10 +254,22 @@ def cli_venv(extras: list[str], hidden_executables: list[str]):
     assert found is not None
     assert Path(found) == venv_bin / "dubstub"
 
-    def dubstub_cmd(*args: str | Path, **kwargs: Any):
-        cmd("dubstub", *args, **kwargs, env=env)
+    with ThreadPoolExecutor() as executor:
+        pending: list[tuple[Future[CmdResult], str | None]] = []
+
+        def dubstub_cmd(*args: str | Path, expect_fail: str | None = None, concurrent: bool = False):
+            if concurrent:
+                # only used for invocations that do not touch any shared files
+                pending.append((executor.submit(run_cmd, "dubstub", *args, env=env), expect_fail))
+            else:
+                cmd("dubstub", *args, expect_fail=expect_fail, env=env)
 
-    yield dubstub_cmd
+        yield dubstub_cmd
+
+        for future, expect_fail in pending:
+            out = future.result()
+            print(f"* {shlex.join(out.args)}")
+            check_cmd(out, expect_fail=expect_fail)
 
     print()
 
@@ -187,17 +281,22 @@ def check_cli():
     out_path.mkdir(exist_ok=True)
     (inp_path / "file.py").touch()
 
+    # building the venvs is independent of each other, so do it upfront and concurrently
+    venv_extras: list[list[str]] = [[], ["def_fmt"], ["eval"], ["eval", "def_fmt"]]
+    with ThreadPoolExecutor(max_workers=len(venv_extras)) as executor:
+        venvs = list(executor.map(dubstub_venv, ["3.10"] * len(venv_extras), venv_extras))
+
     gen_ = ["gen", "--input", inp_path, "--output", out_path]
     eval_ = ["eval", "--input", inp_path, "--output", out_path]
     diff_ = ["diff", "--eval", out_path]
 
-    with cli_venv([], ["pyright", "black", "isort", "stubgen"]) as dubstub:
-        dubstub("--help")
-        dubstub("gen", "--help")
-        dubstub("eval", "--help")
-        dubstub("diff", "--help")
-        dubstub("config", "--help")
-        dubstub("config")
+    with cli_venv(venvs[0], [], ["pyright", "black", "isort", "stubgen"]) as dubstub:
+        dubstub("--help", concurrent=True)
+        dubstub("gen", "--help", concurrent=True)
+        dubstub("eval", "--help", concurrent=True)
+        dubstub("diff", "--help", concurrent=True)
+        dubstub("config", "--help", concurrent=True)
+        dubstub("config", concurrent=True)
 
         dubstub(*gen_)
         dubstub(*gen_, "--format=True", expect_fail="can be installed with `def_fmt` extra")
@@ -207,16 +306,16 @@ def check_cli():
 
         dubstub(*diff_, expect_fail="The `eval` extra seems to not be installed")
 
-    with cli_venv(["def_fmt"], ["pyright", "stubgen"]) as dubstub:
+    with cli_venv(venvs[1], ["def_fmt"], ["pyright", "stubgen"]) as dubstub:
         dubstub(*gen_, "--format=True")
         dubstub(*eval_, "--format=True", expect_fail="can be installed with `eval` extra")
 
-    with cli_venv(["eval"], ["black", "isort"]) as dubstub:
+    with cli_venv(venvs[2], ["eval"], ["black", "isort"]) as dubstub:
         dubstub(*eval_)
         dubstub(*eval_, "--format=True", expect_fail="can be installed with `def_fmt` extra")
         dubstub(*diff_)
 
-    with cli_venv(["eval", "def_fmt"], []) as dubstub:
+    with cli_venv(venvs[3], ["eval", "def_fmt"], []) as dubstub:
         dubstub(*eval_, "--format=True")
         dubstub(*diff_)
 
@@ -239,18 +338,42 @@ def check_test(py_version: str | None, test_args: str | None):
     else:
         args = []
 
-    for version in versions:
-        print(f"[Test with python {version}]")
+    # the test cases are independent of each other, so pytest-xdist spreads them over
+    # all cpus, shared between the python versions that get tested concurrently
+    workers = max(1, (os.cpu_count() or 1) // len(versions))
+
+    def pytest_cmd(version: str) -> list[str | Path]:
         venv_bin = dubstub_venv(version, ["dev"])
-        cmd(
+        return [
             venv_bin / "pytest",
             "--color=yes" if sys.stdout.isatty() else "--color=auto",
             "-vv",
+            f"--numprocesses={workers}",
             "tests",
             *args,
-            hidden=hidden,
-        )
-        print()
+        ]
+
+    if not hidden:
+        # a single version streams its output directly
+        for version in versions:
+            print(f"[Test with python {version}]")
+            cmd(*pytest_cmd(version), hidden=hidden)
+            print()
+        return
+
+    def run_pytest(version: str) -> CmdResult:
+        return run_cmd(*pytest_cmd(version))
+
+    # the test runs are independent of each other, so we run them concurrently
+    # and report each one as soon as it finishes
+    with ThreadPoolExecutor(max_workers=len(versions)) as executor:
+        futures = {executor.submit(run_pytest, version): version for version in versions}
+        for future in as_completed(futures):
+            out = future.result()
+            print(f"[Test with python {futures[future]}]")
+            print(f"* {shlex.join(out.args)}")
+            check_cmd(out)
+            print()
 
 
 def main():
@@ -290,13 +413,35 @@ def dubstub_venv(version: str, extras: list[str]) -> Path:
 
     venv_path = DEV_CACHE / f"venv-{version}-{venv_suffix}"
     venv_bin = venv_path / "bin"
+    venv_stamp = venv_path / ".stamp"
     # rmtree(venv_path, ignore_errors=True)
 
+    # skip rebuilding the venv if nothing that goes into it changed since the last time
+    digest = venv_inputs_digest(version, extras)
+    dubstub_bin = venv_bin / "dubstub"
+    if venv_stamp.is_file() and venv_stamp.read_text() == digest and os.access(dubstub_bin, WHICH_MODE):
+        return venv_bin
+
     cmd("uv", "venv", "--python", version, venv_path)
     cmd("uv", "pip", "install", f".{extra_suffix}", "--refresh-package", "dubstub", "--python", venv_bin / "python")
+    venv_stamp.write_text(digest)
     return venv_bin
 
 
+def venv_inputs_digest(version: str, extras: list[str]) -> str:
+    digest = blake2b(digest_size=16)
+    digest.update(f"{version} {sorted(extras)}".encode())
+
+    sources = sorted(
+        entry.path for entry in walk_tree("src") if entry.is_file() and "__pycache__" not in entry.path.split(os.sep)
+    )
+    for path in [Path("pyproject.toml"), *map(Path, sources)]:
+        digest.update(str(path).encode())
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
 if __name__ == "__main__":
     try:
         main()
@@ -1,3 +1,32 @@
-from .cli.main import main as main
-from .config import Config as Config
-from .generate.main import generate_stubs as generate_stubs
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .cli.main import main as main
+    from .config import Config as Config
+    from .generate.fs import generate_stubs_source as generate_stubs_source
+    from .generate.main import generate_stubs as generate_stubs
+
+
+def __getattr__(name: str) -> Any:
+    # NB: The public API is imported lazily, so that importing a single submodule
+    # like `dubstub.config` does not load the cli and all its subcommands.
+
+    # pylint: disable=import-outside-toplevel
+    if name == "main":
+        from .cli.main import main
+
+        return main
+    if name == "Config":
+        from .config import Config
+
+        return Config
+    if name == "generate_stubs":
+        from .generate.main import generate_stubs
+
+        return generate_stubs
+    if name == "generate_stubs_source":
+        from .generate.fs import generate_stubs_source
+
+        return generate_stubs_source
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
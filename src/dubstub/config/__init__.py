@@ -1,21 +1,54 @@
 import sys
+from copy import deepcopy
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from textwrap import dedent
 from types import NoneType, UnionType
-from typing import Annotated, Any, TypeAlias, get_args, get_origin, get_type_hints
+from typing import Annotated, Any, Callable, Hashable, TypeAlias, cast, get_args, get_origin, get_type_hints
 
 from .. import toml
 from .pattern import Pattern
 
 
+@lru_cache(maxsize=32)
+def _load_toml(raw: str) -> dict[str, Any]:
+    return toml.loads(raw)
+
+
+@lru_cache(maxsize=32)
+def _load_toml_file(path: Path, mtime_ns: int, size: int) -> dict[str, Any]:  # pylint: disable=unused-argument
+    # NB: the file stats are only part of the cache key, so that modified files get parsed again
+    with path.open("rb") as file:
+        return toml.load(file)
+
+
+@lru_cache(maxsize=256)
+def _compile_pattern(raw: str | bool) -> Pattern:
+    # NB: Patterns are only interned while alive, this keeps the ones of recently validated configs around
+    return Pattern(raw)
+
+
 @dataclass
 class FormatterCmd:
     name: str
     cmdline: list[str]
+    python_callable: Callable[[list[str]], None] | None = None
+    """
+    If set, this gets called in-process with the substituted `cmdline`,
+    instead of running it as a subprocess. Only available from Python.
+    """
+
+
+def _parse_formatter_cmd(raw: dict[str, Any]) -> FormatterCmd:
+    for key in raw:
+        if key not in ("name", "cmdline"):
+            raise ValueError(f"unknown formatter_cmds key {key}")
+    return FormatterCmd(name=raw["name"], cmdline=list(raw["cmdline"]))
 
 
 RawConfigType: TypeAlias = str | bool | list[FormatterCmd]
+Fingerprint: TypeAlias = tuple[Hashable, ...]
 ValidatedConfigType: TypeAlias = str | Pattern | list[FormatterCmd]
 
 
@@ -298,6 +331,20 @@ class Config:
         """,
     ] = None
 
+    ast_cache_dir: Annotated[
+        str | None,
+        str,
+        """
+        Directory in which parsed python files get cached across runs.
+
+        Parsing is skipped for any input file whose content has not changed since it
+        has last been cached. The cache is disabled if this is set to an empty string.
+
+        Note that the cache entries are pickled, so the directory should not be shared
+        with untrusted users.
+        """,
+    ] = None
+
     @staticmethod
     def get_fields() -> dict[str, Field]:
         """
@@ -352,20 +399,66 @@ class Config:
         config = Config()
 
         if obj is None:
-            if raw is None:
-                if path is None:
-                    raise ValueError("one of the function arguments needs to be set")
-                raw = path.read_text()
-            obj = toml.loads(raw)
+            # parsed toml is cached, so we hand out a copy that can be modified freely
+            if raw is not None:
+                obj = deepcopy(_load_toml(raw))
+            elif path is not None:
+                stat = path.stat()
+                obj = deepcopy(_load_toml_file(path.resolve(), stat.st_mtime_ns, stat.st_size))
+            else:
+                raise ValueError("one of the function arguments needs to be set")
 
         raw_config = obj.get("tool", {}).get("dubstub", {})
         for field, val in raw_config.items():
             if field not in Config.get_fields():
                 raise ValueError(f"unknown config key {field}")
+            if field == "formatter_cmds" and isinstance(val, list):
+                # NB: toml tables are parsed as plain dicts
+                cmds = cast(list[FormatterCmd | dict[str, Any]], val)
+                val = [_parse_formatter_cmd(cmd) if isinstance(cmd, dict) else cmd for cmd in cmds]
             config.set(field, val)
 
         return config
 
+    def fingerprint(self) -> Fingerprint:
+        """
+        Returns a hashable snapshot of all field values.
+
+        Configs with the same fingerprint validate to the same result.
+        """
+
+        ret: list[Hashable] = []
+        for field in self.get_fields():
+            value = self.get(field)
+            if isinstance(value, list):
+                value = tuple((cmd.name, tuple(cmd.cmdline), cmd.python_callable) for cmd in value)
+            ret.append(value)
+        return tuple(ret)
+
+    @staticmethod
+    def from_fingerprint(fingerprint: Fingerprint) -> "Config":
+        """
+        Creates a config from a snapshot returned by `fingerprint()`.
+        """
+
+        config = Config()
+        for field, value in zip(Config.get_fields(), fingerprint):
+            if field == "formatter_cmds" and value is not None:
+                cmds = cast(tuple[tuple[str, tuple[str, ...], Callable[[list[str]], None] | None], ...], value)
+                value = [FormatterCmd(name, list(cmdline), python_callable) for name, cmdline, python_callable in cmds]
+            config.set(field, cast(RawConfigType | None, value))
+        return config
+
+    def validate_cached(self) -> "ValidatedConfig":
+        """
+        Like `validate()`, but reuses the result of previous calls for configs with the same fingerprint.
+
+        Each call returns its own copy, so the result can be modified freely.
+        """
+
+        # NB: The compiled patterns are interned, so the copy shares them with the cached config
+        return deepcopy(_validate_fingerprint(self.fingerprint()))
+
     def validate(self) -> "ValidatedConfig":
         """
         Validate the Config, which involves additional checks,
@@ -376,22 +469,24 @@ class Config:
         validated = ValidatedConfig()
         validated.profile = self.profile or "default"
 
+        defaults = PROFILE_DEFAULTS.get(validated.profile)
+        if defaults is None:
+            raise ValueError(f"unknown profile {validated.profile}")
+
         for field, meta in self.get_fields().items():
             if field == "profile":
                 continue
 
             value = self.get(field)
             if value is None:
-                value = PROFILES[validated.profile].fields.get(field)
-            if value is None:
-                value = PROFILES["default"].fields.get(field)
+                value = defaults.get(field)
             assert value is not None, "value not found in default profile"
 
             validated.set(field, value)
 
             if meta.validated_ty.ty is Pattern:
                 assert isinstance(value, (bool, str))
-                validated.pattern[value] = Pattern(value)
+                validated.pattern[value] = _compile_pattern(value)
 
         # check that we did not forget about any field
         for field in validated.get_fields():
@@ -436,6 +531,11 @@ class ValidatedConfig(Config):
         return self.get_pattern(self.format), self.formatter_cmds
 
 
+@lru_cache(maxsize=64)
+def _validate_fingerprint(fingerprint: Fingerprint) -> ValidatedConfig:
+    return Config.from_fingerprint(fingerprint).validate()
+
+
 @dataclass
 class Profile:
     fields: Config
@@ -503,6 +603,7 @@ PROFILES: dict[str, Profile] = {
                     ],
                 ),
             ],
+            ast_cache_dir="",
         ),
         """
         The default profile tries to have sensible defaults that match
@@ -516,6 +617,7 @@ PROFILES: dict[str, Profile] = {
         - Class attributes are also looked for in `__init__()` method assignments.
         - Unused imports are remove.
         - Autoformatting is disabled, but will use isort and black with default settings if enabled.
+        - Parsed files are not cached.
         """,
     ),
     "no_privacy": Profile(
@@ -549,3 +651,21 @@ PROFILES: dict[str, Profile] = {
         """,
     ),
 }
+
+
+def _resolve_profile_defaults(name: str) -> dict[str, RawConfigType]:
+    defaults: dict[str, RawConfigType] = {}
+    for field in Config.get_fields():
+        value = PROFILES[name].fields.get(field)
+        if value is None:
+            value = PROFILES["default"].fields.get(field)
+        if value is not None:
+            defaults[field] = value
+    return defaults
+
+
+PROFILE_DEFAULTS: dict[str, dict[str, RawConfigType]] = {name: _resolve_profile_defaults(name) for name in PROFILES}
+"""
+All default values of each profile, with fields not set by a profile
+filled in from the `default` profile.
+"""
@@ -1,28 +1,51 @@
 from dataclasses import dataclass
-from enum import Enum
+from enum import IntFlag
 
 
-class Tag(Enum):
-    MODULE = "module"
-    CLASS = "class"
-    FUNCTION = "function"
-    IMPORT = "import"
-    TYPE_ALIAS = "type_alias"
-    VARIABLE = "variable"
-    ANNOTATED = "annotated"
-    ASSIGNED = "assigned"
-    IF = "if"
-    DOCSTRING = "docstring"
-    ELLIPSIS = "ellipsis"
-    SPACER = "spacer"
+class Tag(IntFlag):
+    """
+    Tags of a node. Multiple tags can be combined into a single bit mask.
+    """
 
+    MODULE = 1 << 0
+    CLASS = 1 << 1
+    FUNCTION = 1 << 2
+    IMPORT = 1 << 3
+    TYPE_ALIAS = 1 << 4
+    VARIABLE = 1 << 5
+    ANNOTATED = 1 << 6
+    ASSIGNED = 1 << 7
+    IF = 1 << 8
+    DOCSTRING = 1 << 9
+    ELLIPSIS = 1 << 10
+    SPACER = 1 << 11
 
-@dataclass
+    @property
+    def label(self) -> str:
+        """the name of a single tag as used in patterns"""
+
+        assert self.name is not None
+        return self.name.lower()
+
+
+_TAG_SETS: dict[Tag, frozenset[Tag]] = {}
+
+
+def tag_set(mask: Tag) -> frozenset[Tag]:
+    """split a tag bit mask into a set of single tags, interned per mask"""
+
+    tags = _TAG_SETS.get(mask)
+    if tags is None:
+        tags = _TAG_SETS[mask] = frozenset(tag for tag in Tag if tag & mask)
+    return tags
+
+
+@dataclass(slots=True, frozen=True)
 class MatchContext:
-    parent_tags: set[Tag]
-    tags: set[Tag]
+    parent_tags: Tag
+    tags: Tag
     file_path: str
     name: str | None = None
     annotation: str | None = None
     value: str | None = None
-    child_tags: set[Tag] | None = None
+    child_tags: Tag | None = None
@@ -1,11 +1,12 @@
 import ast
+import re
 from pathlib import Path
-from types import CodeType
-from typing import Any, Callable, TypeGuard
+from typing import Any, Callable, Sequence, TypeAlias, TypeGuard
+from weakref import WeakValueDictionary
 
 from ..source import AstConfig, Source
-from ..util import regex_match
-from .match_ctx import MatchContext
+from ..util import compile_regex
+from .match_ctx import MatchContext, Tag, tag_set
 
 FUNCTIONS = [
     "parent_node_is",
@@ -79,45 +80,218 @@ class AstValidator:
         return True
 
 
-def make_pattern_eval(compiled: CodeType) -> Callable[[MatchContext], bool]:
-    def inner(ctx: MatchContext) -> bool:
-        class Funcs:
-            @staticmethod
-            def parent_node_is(pat: str) -> bool:
-                return regex_match(pat, [tag.value for tag in ctx.parent_tags])
-
-            @staticmethod
-            def node_is(pat: str) -> bool:
-                return regex_match(pat, [tag.value for tag in ctx.tags])
-
-            @staticmethod
-            def name_is(pat: str) -> bool:
-                return ctx.name is not None and regex_match(pat, ctx.name)
-
-            @staticmethod
-            def file_path_is(pat: str) -> bool:
-                return regex_match(pat, ctx.file_path)
-
-            @staticmethod
-            def annotation_is(pat: str) -> bool:
-                return ctx.annotation is not None and regex_match(pat, ctx.annotation)
-
-            @staticmethod
-            def value_is(pat: str) -> bool:
-                return ctx.value is not None and regex_match(pat, ctx.value)
-
-            @staticmethod
-            def any_child_node_is(pat: str) -> bool:
-                return ctx.child_tags is not None and regex_match(pat, [tag.value for tag in ctx.child_tags])
-
-        env = {func: getattr(Funcs, func) for func in FUNCTIONS}
-
-        # pylint: disable-next=eval-used
-        ret = eval(compiled, env, env)
-        assert isinstance(ret, bool)
-        return ret
-
-    return inner
+Matcher: TypeAlias = Callable[[MatchContext], bool]
+
+_REGEX_META = re.compile(r"[.*+?^${}()|[\]\\]")
+_TAGS_BY_LABEL = {tag.label: tag for tag in Tag}
+
+
+def literal_tags(pat: str) -> Tag | None:
+    """
+    Returns the mask of the tags named by a plain `label|label|...` pattern.
+
+    Returns `None` if the pattern contains any other regex syntax, or names an unknown tag.
+    """
+
+    mask = Tag(0)
+    for part in pat.split("|"):
+        if _REGEX_META.search(part) or part not in _TAGS_BY_LABEL:
+            return None
+        mask |= _TAGS_BY_LABEL[part]
+    return mask
+
+
+def _any_tag_matches(fullmatch: Callable[[str], re.Match[str] | None], tags: Tag) -> bool:
+    return any(fullmatch(tag.label) for tag in tag_set(tags))
+
+
+# pylint: disable-next=too-many-return-statements
+def lower_call(func: str, pat: str) -> Matcher:
+    """
+    Turn a pattern function call into a matcher.
+
+    The regex argument gets compiled once here, instead of on each match.
+    """
+
+    if func in ("parent_node_is", "node_is", "any_child_node_is"):
+        mask = literal_tags(pat)
+        if mask is not None:
+            # literal tag names do not need a regex, a bit mask test is enough
+            match func:
+                case "parent_node_is":
+                    return lambda ctx: bool(ctx.parent_tags & mask)
+                case "node_is":
+                    return lambda ctx: bool(ctx.tags & mask)
+                case _:
+                    return lambda ctx: ctx.child_tags is not None and bool(ctx.child_tags & mask)
+
+    fullmatch = compile_regex(pat).fullmatch
+
+    match func:
+        case "parent_node_is":
+            return lambda ctx: _any_tag_matches(fullmatch, ctx.parent_tags)
+        case "node_is":
+            return lambda ctx: _any_tag_matches(fullmatch, ctx.tags)
+        case "name_is":
+            return lambda ctx: ctx.name is not None and fullmatch(ctx.name) is not None
+        case "file_path_is":
+            return lambda ctx: fullmatch(ctx.file_path) is not None
+        case "annotation_is":
+            return lambda ctx: ctx.annotation is not None and fullmatch(ctx.annotation) is not None
+        case "value_is":
+            return lambda ctx: ctx.value is not None and fullmatch(ctx.value) is not None
+        case "any_child_node_is":
+            return lambda ctx: ctx.child_tags is not None and _any_tag_matches(fullmatch, ctx.child_tags)
+        case _:
+            raise ValueError(f"unsupported function name: {func}")
+
+
+OP_CONST = 0
+OP_CALL = 1
+OP_NOT = 2
+OP_JUMP_IF_FALSE = 3
+OP_JUMP_IF_TRUE = 4
+
+Op: TypeAlias = tuple[int, Any]
+
+
+def merge_literal_calls(values: list[ast.expr]) -> list[ast.expr]:
+    """
+    Merge the operands of an `or` that call the same pattern function with a literal
+    argument into a single call with an alternation, so that eg
+    `node_is('class') or node_is('function')` becomes `node_is('class|function')`.
+
+    Arguments with regex syntax are left alone, so that combining them can not change their meaning.
+    """
+
+    merged: list[ast.expr] = []
+    literals: dict[str, tuple[int, list[str]]] = {}
+    for value in values:
+        match value:
+            case ast.Call(ast.Name(func), [ast.Constant(pat)]) if isinstance(pat, str) and not _REGEX_META.search(pat):
+                if func in literals:
+                    literals[func][1].append(pat)
+                    continue
+                literals[func] = (len(merged), [pat])
+            case _:
+                pass
+        merged.append(value)
+
+    for func, (i, pats) in literals.items():
+        if len(pats) > 1:
+            merged[i] = ast.Call(ast.Name(func, ast.Load()), [ast.Constant("|".join(pats))], [])
+
+    return merged
+
+
+def emit_ops(node: ast.AST, ops: list[Op]):
+    """
+    Append the ops for a validated pattern expression to `ops`.
+
+    The ops operate on a single boolean register that holds the value
+    of the last evaluated expression. `and`/`or` jump past their remaining
+    operands as soon as the result is known, just like in Python.
+    """
+
+    match node:
+        case ast.Constant(value) if isinstance(value, bool):
+            ops.append((OP_CONST, value))
+        case ast.Call(ast.Name(func), [ast.Constant(pat)]) if isinstance(pat, str):
+            ops.append((OP_CALL, lower_call(func, pat)))
+        case ast.UnaryOp(ast.Not(), operand):
+            emit_ops(operand, ops)
+            ops.append((OP_NOT, None))
+        case ast.BoolOp(ast.And() | ast.Or() as op, values):
+            jump_op = OP_JUMP_IF_FALSE if isinstance(op, ast.And) else OP_JUMP_IF_TRUE
+            if isinstance(op, ast.Or):
+                values = merge_literal_calls(values)
+            jumps: list[int] = []
+            for value in values[:-1]:
+                emit_ops(value, ops)
+                jumps.append(len(ops))
+                ops.append((jump_op, None))
+            emit_ops(values[-1], ops)
+            for jump in jumps:
+                ops[jump] = (jump_op, len(ops))
+        case _:
+            raise ValueError(f"unsupported pattern node: ast.{type(node).__name__}")
+
+
+def run_ops(ops: list[Op], ctx: MatchContext) -> bool:
+    value = False
+    pc = 0
+    end = len(ops)
+    while pc < end:
+        opcode, arg = ops[pc]
+        pc += 1
+        if opcode == OP_CALL:
+            value = arg(ctx)
+        elif opcode == OP_JUMP_IF_FALSE:
+            if not value:
+                pc = arg
+        elif opcode == OP_JUMP_IF_TRUE:
+            if value:
+                pc = arg
+        elif opcode == OP_NOT:
+            value = not value
+        else:
+            value = arg
+    return value
+
+
+def always_true(ctx: MatchContext) -> bool:  # pylint: disable=unused-argument
+    return True
+
+
+def always_false(ctx: MatchContext) -> bool:  # pylint: disable=unused-argument
+    return False
+
+
+def lower_pattern(node: ast.AST) -> Matcher:
+    """
+    Turn a validated pattern expression into a matcher.
+    """
+
+    # patterns that do not depend on the context do not need to look at it
+    constant = fold_constant_pattern(node)
+    if constant is not None:
+        return always_true if constant else always_false
+
+    ops: list[Op] = []
+    emit_ops(node, ops)
+
+    # single function calls do not need the evaluation loop
+    if len(ops) == 1 and ops[0][0] == OP_CALL:
+        call: Matcher = ops[0][1]
+        return call
+
+    return lambda ctx: run_ops(ops, ctx)
+
+
+def fold_constant_pattern(node: ast.AST) -> bool | None:
+    """
+    Evaluate a validated pattern expression as far as possible without a match context.
+
+    Returns `None` if the result depends on the match context.
+    """
+
+    match node:
+        case ast.Constant(value) if isinstance(value, bool):
+            return value
+        case ast.UnaryOp(ast.Not(), operand):
+            folded = fold_constant_pattern(operand)
+            return None if folded is None else not folded
+        case ast.BoolOp(ast.And() | ast.Or() as op, values):
+            # NB: all pattern functions are free of side effects, so we can ignore evaluation order
+            absorbing = isinstance(op, ast.Or)
+            folded_values = [fold_constant_pattern(value) for value in values]
+            if absorbing in folded_values:
+                return absorbing
+            if None in folded_values:
+                return None
+            return not absorbing
+        case _:
+            return None
 
 
 def parse_pattern(pattern: bool | str) -> tuple[Callable[[MatchContext], bool], ast.Expression]:
@@ -132,22 +306,59 @@ def parse_pattern(pattern: bool | str) -> tuple[Callable[[MatchContext], bool],
         raise ValueError(
             f"Pattern is not allowed to contain Python AST element: `{source.unparse(parsed)}` ({', '.join(validator.reasons)})"
         )
-    compiled = compile(parsed, "<pattern>", mode="eval")
-    return make_pattern_eval(compiled), parsed
+    return lower_pattern(parsed.body), parsed
+
+
+_PATTERN_CACHE: "WeakValueDictionary[bool | str, Pattern]" = WeakValueDictionary()
 
 
 class Pattern:
+    __slots__ = ("pattern", "_raw", "_parsed", "_constant", "__weakref__")
+
     pattern: Callable[[MatchContext], bool]
     _raw: bool | str
     _parsed: ast.Expression
+    _constant: bool | None
+
+    def __new__(cls, pattern: bool | str) -> "Pattern":
+        # Patterns are immutable, so instances get shared between identical raw patterns
+        cached = _PATTERN_CACHE.get(pattern)
+        if cached is not None:
+            return cached
 
-    def __init__(self, pattern: bool | str):
+        self = super().__new__(cls)
         self.pattern, self._parsed = parse_pattern(pattern)
         self._raw = pattern
+        self._constant = fold_constant_pattern(self._parsed.body)
+        _PATTERN_CACHE[pattern] = self
+        return self
 
     def is_match(self, ctx: MatchContext) -> bool:
         return self.pattern(ctx)
 
+    def is_match_many(self, contexts: Sequence[MatchContext]) -> list[bool]:
+        """match a whole batch of contexts, returning one result per context"""
+
+        if self._constant is not None:
+            return [self._constant] * len(contexts)
+
+        pattern = self.pattern
+        return [pattern(ctx) for ctx in contexts]
+
+    def is_always_true(self) -> bool:
+        """returns true if the pattern matches independent of the match context"""
+
+        return self._constant is True
+
+    def is_always_false(self) -> bool:
+        """returns true if the pattern never matches, independent of the match context"""
+
+        return self._constant is False
+
+    def __reduce__(self) -> tuple[type["Pattern"], tuple[bool | str]]:
+        # the compiled matcher can not be pickled, so we recompile it from the raw pattern
+        return (Pattern, (self._raw,))
+
     def __bool__(self):
         raise TypeError
 
@@ -161,3 +372,8 @@ class Pattern:
 
     def __repr__(self) -> str:
         return f"Pattern({repr(str(self))})"
+
+
+# NB: the constant patterns are used by most profiles, so we keep them alive in the interning cache
+TRUE_PATTERN = Pattern(True)
+FALSE_PATTERN = Pattern(False)
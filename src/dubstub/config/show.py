@@ -48,6 +48,9 @@ def fmt_config_dict(config: Config, show_format: str) -> dict[str, Json]:
 
 
 def fmt_config(config: Config, show_format: str) -> str:
+    if show_format == "toml":
+        return fmt_config_toml(config)
+
     out = fmt_config_dict(config, show_format)
 
     ret = ""
@@ -57,8 +60,11 @@ def fmt_config(config: Config, show_format: str) -> str:
     elif show_format == "json":
         out_with_header = {"tool": {"dubstub": out}}
         ret = json.dumps(out_with_header, indent=4)
-    elif show_format == "toml":
-        out_with_header = {"tool": {"dubstub": out}}
-        ret = toml.dumps(out_with_header, indent=4, multiline_strings=True)
 
     return ret.strip()
+
+
+def fmt_config_toml(config: Config) -> str:
+    out = fmt_config_dict(config, "toml")
+    out_with_header = {"tool": {"dubstub": out}}
+    return toml.dumps(out_with_header, indent=4, multiline_strings=True).strip()
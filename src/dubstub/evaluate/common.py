@@ -0,0 +1,9 @@
+from pathlib import Path
+from shutil import copy2
+
+
+def generate_copy(inp: Path, out: Path):
+    # in copy mode we just copy the pyi file as-is
+
+    out.parent.mkdir(exist_ok=True, parents=True)
+    copy2(inp, out)
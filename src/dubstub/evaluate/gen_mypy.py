@@ -1,63 +1,204 @@
+import os
 import subprocess
+import sys
+from functools import lru_cache
+from hashlib import blake2b
 from pathlib import Path
-from shutil import copy2
+from shutil import copytree
 from tempfile import TemporaryDirectory
+from typing import Collection
 
 from ..config import ValidatedConfig
 from ..format import format_pyi_tree
 from ..fs import Event, Kind, Walker, remove, walk_dir
+from ..util import DEBUG
+from .common import generate_copy
 
+_PY_SUFFIXES = frozenset((".py", ".pyi"))
 
-def generate_copy(inp: Path, out: Path):
-    # in copy mode we just copy the pyi file as-is
+# If set, stubgen output gets cached in this directory, keyed by the content of its input
+MYPY_CACHE_ENV = "DUBSTUB_MYPY_CACHE"
+MYPY_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
-    out.parent.mkdir(exist_ok=True, parents=True)
-    copy2(inp, out)
+_STUBGEN_FLAGS = (
+    *(("--verbose",) if DEBUG else ()),
+    # "--inspect-mode",
+    "--include-docstrings",
+)
 
 
 def run_mypy(tmp: Path, dir_or_file: Path, out_dir: Path):
-    cmd = [
-        "stubgen",
-        "--verbose",
-        # "--inspect-mode",
-        "--include-docstrings",
+    """
+    Runs stubgen with `tmp` as its working directory.
+
+    Failures are always reported as `subprocess.CalledProcessError`, no matter if
+    stubgen runs in-process or as a subprocess.
+
+    NB: When running in-process, this temporarily changes the working directory
+    of the whole process, so it is not thread-safe.
+    """
+
+    args = [
+        *_STUBGEN_FLAGS,
         "-o",
         str(out_dir),
         str(dir_or_file),
     ]
-    cwd = tmp
-    subprocess.run(
-        cmd,
-        cwd=cwd,
-        check=True,
-    )
+
+    try:
+        # pylint:disable=import-outside-toplevel
+        from mypy import stubgen
+        from mypy.errors import CompileError
+    except ImportError:
+        # mypy is not importable from our own interpreter, so fall back to
+        # whatever `stubgen` executable is on the PATH
+        subprocess.run(["stubgen", *args], cwd=tmp, check=True)
+        return
+
+    # calling stubgen in-process saves an interpreter startup and mypy import per root
+    old_cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        stubgen.generate_stubs(stubgen.parse_options(args))
+    except SystemExit as exc:
+        # stubgen exits on invalid input, which must not end a library caller's process
+        # (`exc.code` is either the exit status or the error message)
+        if isinstance(exc.code, int):
+            raise subprocess.CalledProcessError(exc.code, ["stubgen", *args]) from exc
+        raise subprocess.CalledProcessError(1, ["stubgen", *args], output=exc.code) from exc
+    except CompileError as exc:
+        raise subprocess.CalledProcessError(1, ["stubgen", *args], output="\n".join(exc.messages)) from exc
+    finally:
+        os.chdir(old_cwd)
+
+
+@lru_cache(maxsize=None)
+def _mypy_version() -> str:
+    try:
+        from mypy.version import __version__  # pylint:disable=import-outside-toplevel
+    except ImportError:
+        out = subprocess.run(["stubgen", "--version"], check=True, capture_output=True, encoding="utf-8")
+        return out.stdout.strip()
+    return __version__
+
+
+def _mypy_cache_key(inp: Path) -> str:
+    digest = blake2b(digest_size=16)
+    digest.update(_mypy_version().encode() + b"\0")
+    digest.update(repr(_STUBGEN_FLAGS).encode() + b"\0")
+    digest.update(str(inp).encode() + b"\0")
+
+    # mypy walks up the directory tree to find the root of the package,
+    # so the surrounding `__init__` files influence its output as well
+    for parent in inp.parents:
+        for init in (parent / "__init__.py", parent / "__init__.pyi"):
+            if init.is_file():
+                digest.update(str(init).encode() + b"\0")
+                digest.update(init.read_bytes() + b"\0")
+
+    for path in walk_dir(inp):
+        if path.suffix in _PY_SUFFIXES and path.is_file():
+            digest.update(str(path).encode() + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+
+    return digest.hexdigest()
+
+
+def _tree_size(path: Path) -> int:
+    size = 0
+    for dirname, _, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.stat(os.path.join(dirname, filename)).st_size
+    return size
+
+
+def _evict_mypy_cache(cache_dir: Path):
+    # drop the least recently used entries until we are below the size limit
+    entries: list[tuple[int, int, Path]] = []
+    for entry in cache_dir.iterdir():
+        # staging directories belong to runs that are still in progress
+        if entry.suffix == ".tmp":
+            continue
+
+        # NB: Other runs may evict entries concurrently, so they can vanish at any point
+        try:
+            entries.append((entry.stat().st_mtime_ns, int((entry / "size").read_text()), entry))
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= MYPY_CACHE_MAX_BYTES:
+            break
+        try:
+            remove(entry)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def run_mypy_cached(tmp: Path, dir_or_file: Path, out_dir: Path):
+    cache_env = os.environ.get(MYPY_CACHE_ENV)
+    if not cache_env:
+        run_mypy(tmp, dir_or_file, out_dir)
+        return
+
+    # each cache entry is a directory with the stubgen output in `out`,
+    # and its size in bytes in `size`, so that evicting never needs to walk the entries
+    cache_dir = Path(cache_env)
+    cache_entry = cache_dir / _mypy_cache_key(dir_or_file)
+    if cache_entry.is_dir():
+        os.utime(cache_entry)
+        copytree(cache_entry / "out", out_dir, dirs_exist_ok=True)
+        return
+
+    run_mypy(tmp, dir_or_file, out_dir)
+
+    # copy to a staging directory first, so that concurrent runs never see a partial entry
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    staging = cache_dir / f"{cache_entry.name}.{os.getpid()}.tmp"
+    copytree(out_dir, staging / "out")
+    (staging / "size").write_text(str(_tree_size(staging / "out")))
+    try:
+        staging.rename(cache_entry)
+    except OSError:
+        remove(staging)
+
+    _evict_mypy_cache(cache_dir)
 
 
 def find_module_structure(path: Path) -> list[tuple[str, ...]]:
     modules: set[tuple[str, ...]] = set()
 
-    for subpath in walk_dir(path):
-        subpath_is_file = subpath.is_file()
+    if path.is_file():
+        if path.suffix in _PY_SUFFIXES:
+            modules.add(())
+        return sorted(modules)
 
-        if subpath_is_file and subpath.suffix in (".py", ".pyi"):
-            if subpath == path:
-                modules.add(tuple())
-            else:
-                rel_parts = subpath.parent.relative_to(path).parts
-                if subpath.stem == "__init__":
-                    modules.add(tuple([*rel_parts]))
-                else:
-                    modules.add(tuple([*rel_parts, subpath.stem]))
+    # NB: This works on the plain strings from `os.walk()`, as creating a `Path`
+    # and calling `is_file()` for every entry dominates the runtime for large trees.
+    # `os.walk()` yields directory names that start with the root, so we can just slice it off
+    root = os.fspath(path)
+    root_len = len(os.path.join(root, ""))
+    for dirname, _, filenames in os.walk(root):
+        # NB: The components get interned so that the structures found for different trees share
+        # the same string objects, which makes comparing them mostly a matter of identity checks
+        rel_parts = tuple(map(sys.intern, dirname[root_len:].split(os.sep))) if dirname != root else ()
 
-    for found in modules.copy():
-        while len(found) > 0:
-            found = tuple(list(found)[:-1])
-            modules.add(found)
+        for filename in filenames:
+            stem, suffix = os.path.splitext(filename)
+            if suffix not in _PY_SUFFIXES:
+                continue
+
+            module = rel_parts if stem == "__init__" else (*rel_parts, sys.intern(stem))
+
+            # every parent of a module is part of the structure as well
+            modules.update(module[:i] for i in range(len(module) + 1))
 
     return sorted(modules)
 
 
-def evaluate_structure(expected: list[tuple[str, ...]], current: list[tuple[str, ...]]) -> tuple[float, int]:
+def evaluate_structure(expected: frozenset[tuple[str, ...]], current: frozenset[tuple[str, ...]]) -> tuple[float, int]:
     """
     Evaluates how much the `current` structure matches the `expected` structure.
 
@@ -66,15 +207,8 @@ def evaluate_structure(expected: list[tuple[str, ...]], current: list[tuple[str,
     - a integer that counts the number of extra elements in the current structure that do not exist in the expected structure.
     """
 
-    found = 0
-    extra = 0
-
-    for exp in expected:
-        if exp in current:
-            found += 1
-    for ext in current:
-        if ext not in expected:
-            extra += 1
+    found = len(expected & current)
+    extra = len(current - expected)
 
     # NB: If we have zero paths, we just compute a value of 0.0
     found_percent = float(found) / float(max(len(expected), 1))
@@ -83,29 +217,26 @@ def evaluate_structure(expected: list[tuple[str, ...]], current: list[tuple[str,
 
 
 def evaluate_structures(
-    expected: list[tuple[str, ...]],
-    current: list[tuple[str, ...]],
+    expected: frozenset[tuple[str, ...]],
+    current: Collection[tuple[str, ...]],
     ctx: tuple[str, ...],
 ) -> list[tuple[float, int, tuple[str, ...]]]:
     ret: list[tuple[float, int, tuple[str, ...]]] = []
 
-    found_percent, extra = evaluate_structure(expected, current)
-    ret.append((found_percent, extra, ctx))
+    def visit(current: frozenset[tuple[str, ...]], ctx: tuple[str, ...]):
+        found_percent, extra = evaluate_structure(expected, current)
+        ret.append((found_percent, extra, ctx))
 
-    child_names: set[str] = set()
-    for cur in current:
-        if len(cur) < 1:
-            continue
-        child_names.add(cur[0])
-
-    for child_name in child_names:
-        children: set[tuple[str, ...]] = set()
+        # group all entries by their first component in a single pass
+        children: dict[str, set[tuple[str, ...]]] = {}
         for cur in current:
-            if len(cur) > 0 and cur[0] == child_name:
-                children.add(cur[1:])
-        child_ctx = ctx + (child_name,)
-        ret.extend(evaluate_structures(expected, list(children), child_ctx))
+            if cur:
+                children.setdefault(cur[0], set()).add(cur[1:])
+
+        for child_name, child in children.items():
+            visit(frozenset(child), ctx + (child_name,))
 
+    visit(frozenset(current), ctx)
     return ret
 
 
@@ -127,10 +258,16 @@ def find_mypy_out_subdir(mypy_inp_path: Path, mypy_out_path: Path) -> Path:
 
     expected = find_module_structure(mypy_inp_path)
     current = find_module_structure(mypy_out_path)
-    evaluated = evaluate_structures(expected, current, ())
-    weighted = sorted(evaluated, key=lambda tup: (1.0 - tup[0], tup[1]))
 
-    return Path(*weighted[0][2])
+    # NB: An exact match at the root is the best possible score, so we can skip the search
+    if expected == current:
+        return Path()
+
+    evaluated = evaluate_structures(frozenset(expected), current, ())
+    # NB: like a stable sort, `min()` keeps the first of several equally good candidates
+    best = min(evaluated, key=lambda tup: (-tup[0], tup[1]))
+
+    return Path(*best[2])
 
 
 def generate_mypy(root: Event, stub_events: list[Event]):
@@ -144,7 +281,7 @@ def generate_mypy(root: Event, stub_events: list[Event]):
         tmp_out.mkdir()
 
         # call mypy
-        run_mypy(tmp, inp, tmp_out)
+        run_mypy_cached(tmp, inp, tmp_out)
 
         # Analyze mypy's output directory to figure out which of the files
         # in there match the input and output paths from the stub events.
@@ -238,6 +375,12 @@ def get_root_relative_out_paths(root: Event, stub_events: list[Event]) -> list[t
 
 
 def generate(inp_root: Path, out_root: Path, config: ValidatedConfig):
+    """
+    Generates type stubs with mypy's stubgen.
+
+    NB: This is not thread-safe, see `run_mypy()`.
+    """
+
     walker = Walker(inp_root, out_root)
     roots = group_per_root(walker)
     for root, stub_events, copy_events in roots:
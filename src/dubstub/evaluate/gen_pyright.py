@@ -3,20 +3,14 @@ import json
 import re
 import subprocess
 from pathlib import Path
-from shutil import copy2, rmtree
+from shutil import rmtree
 from tempfile import TemporaryDirectory
 
 from ..config import ValidatedConfig
 from ..format import format_pyi_tree
 from ..fs import Kind, Walker, remove, walk_dir
 from ..source import AstConfig, Source
-
-
-def generate_copy(inp: Path, out: Path):
-    # in copy mode we just copy the pyi file as-is
-
-    out.parent.mkdir(exist_ok=True, parents=True)
-    copy2(inp, out)
+from .common import generate_copy
 
 
 def run_pyright(tmp: Path, base_path: Path, module_name: str, config: ValidatedConfig) -> Path:
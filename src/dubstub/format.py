@@ -30,7 +30,7 @@ def _generate_jobs(command: FormatterCmd, py_major: int, py_minor: int, paths: s
                 arg = common_replace(arg)
                 arg = arg.replace("${dubstub_file_arg}", str(path))
                 cmd.append(arg)
-            jobs.append(FormatterCmd(name=command.name, cmdline=cmd))
+            jobs.append(FormatterCmd(name=command.name, cmdline=cmd, python_callable=command.python_callable))
     else:
         cmd: list[str] = []
         for arg in command.cmdline:
@@ -41,11 +41,33 @@ def _generate_jobs(command: FormatterCmd, py_major: int, py_minor: int, paths: s
                     cmd.append(arg_instance)
             else:
                 cmd.append(arg)
-        jobs.append(FormatterCmd(name=command.name, cmdline=cmd))
+        jobs.append(FormatterCmd(name=command.name, cmdline=cmd, python_callable=command.python_callable))
 
     return jobs
 
 
+def _run_job(command: FormatterCmd) -> str | None:
+    """Run a single formatter job, returning its output if it failed"""
+
+    if command.python_callable is not None:
+        try:
+            command.python_callable(command.cmdline)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            return repr(exc)
+        return None
+
+    result = subprocess.run(
+        command.cmdline,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        encoding="utf-8",
+        check=False,
+    )
+    if result.returncode != 0:
+        return result.stdout
+    return None
+
+
 def format_pyi_tree(walker: Walker, config: ValidatedConfig):
     format_, formatter_cmds = config.get_formatting()
     py_major, py_minor = config.get_python_version()
@@ -66,8 +88,8 @@ def format_pyi_tree(walker: Walker, config: ValidatedConfig):
             continue
 
         ctx = MatchContext(
-            set(),
-            {Tag.MODULE},
+            Tag(0),
+            Tag.MODULE,
             event.out_rel_pattern,
         )
 
@@ -87,19 +109,12 @@ def format_pyi_tree(walker: Walker, config: ValidatedConfig):
         jobs.extend(_generate_jobs(command, py_major, py_minor, paths))
 
     for command in jobs:
-        result = subprocess.run(
-            command.cmdline,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            encoding="utf-8",
-            check=False,
-        )
-
-        if result.returncode != 0:
+        output = _run_job(command)
+        if output is not None:
             print(f"{command.name} command failed:")
             print(shlex.join(command.cmdline))
             print("- output ---")
-            print(result.stdout)
+            print(output)
             print("------------")
             failed = True
             break
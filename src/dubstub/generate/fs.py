@@ -26,7 +26,7 @@ def generate_stubs(
     inp: Path = input_path.resolve()
     out: Path = output_path.resolve()
 
-    validated = (config or Config()).validate()
+    validated = (config or Config()).validate_cached()
 
     walker = Walker(inp, out)
 
@@ -35,6 +35,26 @@ def generate_stubs(
     format_pyi_tree(walker, validated)
 
 
+def generate_stubs_source(
+    source: str,
+    config: Config | None = None,
+    relative_path: Path = Path("file.py"),
+) -> str:
+    """
+    Generate the type stub for the python source code in `source`, without touching the filesystem.
+
+    `relative_path` is the path the source would have relative to the input root,
+    it is used for matching file path patterns and for import resolution.
+
+    Unlike `generate_stubs()`, this never runs a formatter over the result.
+
+    Optionally uses the provided `config` (otherwise the default config is used).
+    """
+
+    validated = (config or Config()).validate_cached()
+    return stubgen_single_file_src(source, relative_path, validated)
+
+
 def _generate_stubs(walker: Walker, config: ValidatedConfig):
     # pylint: disable=duplicate-code
 
@@ -1,14 +1,20 @@
 import ast
+import os
+import pickle
 import sys
-from dataclasses import dataclass, field
+from functools import lru_cache
+from hashlib import sha256
+from importlib.metadata import PackageNotFoundError, version
+from io import StringIO
 from pathlib import Path
-from typing import Any, Type
+from typing import Any, Callable, Iterable, Type, TypeAlias
 
 from ..config import ValidatedConfig
 from ..config.match_ctx import MatchContext, Tag
 from ..source import AstConfig, Source
 
-CONSTANT_TYPES: list[Type[Any]] = [
+# NB: a tuple, so it can be passed to `isinstance()` directly
+CONSTANT_TYPES: tuple[Type[Any], ...] = (
     str,
     bytes,
     bool,
@@ -17,45 +23,101 @@ CONSTANT_TYPES: list[Type[Any]] = [
     complex,
     type(...),
     type(None),
-]
+)
+
+# pattern, parent tags, tags, name, annotation, value, child tags
+MatchKey: TypeAlias = tuple[str | bool | None, Tag, Tag, str | None, str | None, str | None, Tag | None]
+
+# statements that are intentionally ignored
+IGNORED_STMT_TYPES: frozenset[type[ast.AST]] = frozenset(
+    [
+        ast.Pass,
+        ast.For,
+        ast.Call,
+        ast.Assert,
+        ast.Delete,
+        ast.Raise,
+        ast.AugAssign,
+        ast.While,
+        ast.Match,
+    ]
+)
+
+
+_INDENT_PREFIXES: list[str] = [""]
+
+
+def _indent_prefix(indent: int) -> str:
+    while len(_INDENT_PREFIXES) <= indent:
+        _INDENT_PREFIXES.append("    " * len(_INDENT_PREFIXES))
+    return _INDENT_PREFIXES[indent]
 
 
-@dataclass
 class Node:
-    lines: list[str] = field(default_factory=list)
+    # NB: We create one of these per emitted line, so we avoid the overhead of
+    # a per-instance `__dict__` and dataclass default factories.
+    __slots__ = ("lines", "children", "tags", "meta")
+
+    lines: list[str]
     """
     Usually a node is a single line, but with annotations and
     block constructs you can end up with more than one
     """
 
-    children: list["Node"] = field(default_factory=list)
+    children: list["Node"]
     """
     If this node can contain sub nodes, the are collected in this list.
     These children may or may not be indented when output, depending on group tag.
     """
 
-    tags: set[Tag] = field(default_factory=set)
+    tags: Tag
     """
-    Tags to identify this node
+    Tags to identify this node, as a bit mask
     """
 
-    meta: dict[str, Any] = field(default_factory=dict)
+    meta: dict[str, Any]
     """
     Extra metadata specific to the type of node
     """
 
-    def add_child(self, *tags: Tag) -> "Node":
-        node = Node(tags=set(tags))
+    def __init__(self, tags: Tag = Tag(0)):
+        self.lines = []
+        self.children = []
+        self.tags = tags
+        self.meta = {}
+
+    def add_child_tag(self, tag: Tag) -> "Node":
+        """
+        Add a child node tagged with `tag`, which may already be a combined mask.
+        """
+
+        node = Node(tag)
         self.children.append(node)
         return node
 
+    def add_child_tags(self, *tags: Tag) -> "Node":
+        mask = Tag(0)
+        for tag in tags:
+            mask |= tag
+        return self.add_child_tag(mask)
+
     def add_line(self, line: str, allow_multiline: bool = False):
         if not allow_multiline:
             assert "\n" not in line, line
         self.lines.append(line)
 
+    def extend_lines(self, lines: Iterable[str]):
+        """
+        Add multiple lines at once.
+
+        Unlike `add_line()`, this does not check for newlines, so it should only be used
+        for lines that can not contain any, like unparsed expressions.
+        """
+
+        self.lines.extend(lines)
+
     def add_tag(self, tag: Tag):
-        self.tags.add(tag)
+        self.tags |= tag
 
 
 class Logger:
@@ -79,19 +141,73 @@ class Logger:
             print("Expected syntax ignored:", msg)
 
 
-# pylint: disable-next=too-many-public-methods
+# pylint: disable-next=too-many-public-methods,too-many-instance-attributes
 class Stubber:
     source: Source
     config: ValidatedConfig
     used_names: set[str]
     logger: Logger
+    _unparse_cache: dict[int, tuple[ast.AST, str]]
+    _match_cache: dict[MatchKey, bool]
+    _never_add_redundant_ellipsis: bool
+    _dispatch: dict[type[ast.AST], Callable[[Node, Any], None]]
 
-    def __init__(self, source: Source, config: ValidatedConfig, used_names: set[str]):
+    def __init__(
+        self,
+        source: Source,
+        config: ValidatedConfig,
+        used_names: set[str],
+        match_cache: dict[MatchKey, bool] | None = None,
+    ):
         self.source = source
         self.config = config
         self.used_names = used_names
         self.logger = Logger()
 
+        # the default config never adds redundant ellipsis, so we can skip matching for it
+        self._never_add_redundant_ellipsis = self.config.get_pattern(
+            self.config.add_redundant_ellipsis
+        ).is_always_false()
+
+        # Pattern matches only depend on their inputs, so this cache can be shared
+        # between all stubbing passes over the same file.
+        self._match_cache = {} if match_cache is None else match_cache
+
+        # NB: We keep a reference to the node itself next to the unparsed string,
+        # so that its id can not be reused by a different node while cached.
+        self._unparse_cache = {}
+
+        # handlers for each statement type we stub
+        self._dispatch = {
+            # module entrypoint
+            ast.Module: self.stub_module,
+            # imports
+            ast.Import: self.stub_import,
+            ast.ImportFrom: self.stub_import,
+            # assignments (eg constant definitions)
+            ast.Assign: self.stub_assign,
+            ast.AnnAssign: self.stub_assign,
+            # class definition
+            ast.ClassDef: self.stub_class,
+            # function definitions
+            ast.FunctionDef: self.stub_func,
+            ast.AsyncFunctionDef: self.stub_func,
+            # expressions (eg doc comments)
+            ast.Expr: self.stub_expr,
+            # if
+            ast.If: self.stub_if,
+            # try
+            ast.Try: self.stub_try,
+            # with
+            ast.With: self.stub_with,
+        }
+        if sys.version_info >= (3, 11):
+            # pylint: disable-next=no-member
+            self._dispatch[ast.TryStar] = self.stub_try_star
+        if sys.version_info >= (3, 12):
+            # pylint: disable-next=no-member
+            self._dispatch[ast.TypeAlias] = self.stub_type_alias
+
     def output(self, ast_module: ast.Module) -> str:
         # to get a more homogenous code structure, we pretend there is a parent for
         # a module ast node
@@ -102,94 +218,46 @@ class Stubber:
         # fully stubbed module
         out = out.children[0]
 
-        # render everything to a flat list of lines
-        lines: list[str] = []
+        # render everything directly into the output text
+        buf = StringIO()
 
-        def collect_lines(node: Node, indent: int):
-            prefix = "    " * indent
+        # NB: We walk the tree with an explicit stack, so deeply nested
+        # code does not run into the recursion limit.
+        stack: list[tuple[Node, int]] = [(out, 0)]
+        while stack:
+            node, indent = stack.pop()
+            prefix = _indent_prefix(indent)
             for l in node.lines:
-                lines.append((prefix + l).rstrip())
+                buf.write((prefix + l).rstrip())
+                buf.write("\n")
 
-            # remove trailing spacers
-            children = node.children[:]
-            while children and Tag.SPACER in children[-1].tags:
-                children.pop()
+            # skip trailing spacers
+            children = node.children
+            end = len(children)
+            while end and children[end - 1].tags & Tag.SPACER:
+                end -= 1
 
-            for child in children:
-                if Tag.MODULE in node.tags:
-                    nested_indent = indent
-                else:
-                    nested_indent = indent + 1
-                collect_lines(child, nested_indent)
+            if node.tags & Tag.MODULE:
+                nested_indent = indent
+            else:
+                nested_indent = indent + 1
 
-        collect_lines(out, 0)
+            # push in reverse, so that the first child gets popped first
+            for i in range(end - 1, -1, -1):
+                stack.append((children[i], nested_indent))
 
-        ret = "\n".join(lines) + "\n"
+        # NB: an empty module still gets rendered as a single empty line
+        ret = buf.getvalue() or "\n"
         return ret
 
     def stub(self, parent: Node, obj: ast.AST):
-        match obj:
-            # module entrypoint
-            case ast.Module():
-                self.stub_module(parent, obj)
-
-            # imports
-            case ast.Import() | ast.ImportFrom():
-                self.stub_import(parent, obj)
-
-            # assignments (eg constant definitions)
-            case ast.Assign() | ast.AnnAssign():
-                self.stub_assign(parent, obj)
-
-            # class definition
-            case ast.ClassDef():
-                self.stub_class(parent, obj)
-
-            # function definitions
-            case ast.FunctionDef() | ast.AsyncFunctionDef():
-                self.stub_func(parent, obj)
-
-            # expressions (eg doc comments)
-            case ast.Expr():
-                self.stub_expr(parent, obj)
-
-            # if
-            case ast.If():
-                self.stub_if(parent, obj)
-
-            # try
-            case ast.Try():
-                self.stub_try(parent, obj)
-            # pylint: disable-next=no-member
-            case _ if sys.version_info >= (3, 11) and isinstance(obj, ast.TryStar):
-                self.stub_try_star(parent, obj)
-
-            # try
-            case ast.With():
-                self.stub_with(parent, obj)
-
-            # type alias
-            # pylint: disable-next=no-member
-            case _ if sys.version_info >= (3, 12) and isinstance(obj, ast.TypeAlias):
-                self.stub_type_alias(parent, obj)
-
-            # intentionally ignored
-            case (
-                ast.Pass()
-                | ast.For()
-                | ast.Call()
-                | ast.Assert()
-                | ast.Delete()
-                | ast.Raise()
-                | ast.AugAssign()
-                | ast.While()
-                | ast.Match()
-            ):
-                self.log_stub_ignore(obj)
-
-            # fallback
-            case _:
-                self.logger.ignore_unhandled(f"{type(obj).__name__} statement (`{self.unparse(obj)}`)")
+        handler = self._dispatch.get(type(obj))
+        if handler is not None:
+            handler(parent, obj)
+        elif type(obj) in IGNORED_STMT_TYPES:
+            self.log_stub_ignore(obj)
+        else:
+            self.logger.ignore_unhandled(f"{type(obj).__name__} statement (`{self.unparse(obj)}`)")
 
     def stub_module(self, parent: Node, obj: ast.Module):
         body = obj.body
@@ -197,7 +265,7 @@ class Stubber:
         if type_ignores:
             self.logger.ignore_unhandled("Type comment on module")
 
-        this = parent.add_child(Tag.MODULE)
+        this = parent.add_child_tag(Tag.MODULE)
         for node in body:
             self.stub(this, node)
 
@@ -222,7 +290,7 @@ class Stubber:
         return name.name.split(".")[0]
 
     def stub_import(self, parent: Node, obj: ast.Import | ast.ImportFrom):
-        tags = {Tag.IMPORT}
+        tags = Tag.IMPORT
 
         keep_unused_import = self.is_match(self.config.keep_unused_imports, parent, tags)
         if not keep_unused_import:
@@ -246,7 +314,7 @@ class Stubber:
 
         line = self.unparse(obj)
         this = Node()
-        this.add_tag(*tags)
+        this.add_tag(tags)
         this.add_line(line)
         insert_pos = len(parent.children)
 
@@ -259,7 +327,7 @@ class Stubber:
             return None
         target_name, annotation, value, type_comment = normalized
 
-        tags = {Tag.VARIABLE}
+        tags = Tag.VARIABLE
 
         if type_comment:
             self.logger.ignore_unhandled("Type comment on variable")
@@ -269,7 +337,7 @@ class Stubber:
         name = target_name.id
 
         # node for this assignment
-        this = Node(tags=tags)
+        this = Node(tags)
         this.meta["name"] = name
 
         # annotation
@@ -293,14 +361,15 @@ class Stubber:
         keep_variable_value = self.is_match(
             self.config.keep_variable_value,
             parent,
-            tags,
+            this.tags,
             name=name,
             annotation=annotation_pattern,
             value=value_pattern,
         )
 
         if not keep_variable_value and value_fragment != "":
-            self.logger.ignore_disabled(f"Pruning value of variable {name}")
+            if self.logger.debug:
+                self.logger.ignore_disabled(f"Pruning value of variable {name}")
             value_fragment = " = ..."
 
         line = target_unparsed + annotation_fragment + value_fragment
@@ -309,13 +378,14 @@ class Stubber:
         keep_definitions = self.is_match(
             self.config.keep_definitions,
             parent,
-            tags,
+            this.tags,
             name=name,
             annotation=annotation_pattern,
             value=value_pattern,
         )
         if not keep_definitions and name not in self.used_names:
-            self.logger.ignore_disabled(f"Pruning variable {name}")
+            if self.logger.debug:
+                self.logger.ignore_disabled(f"Pruning variable {name}")
             return None
 
         return this
@@ -332,19 +402,18 @@ class Stubber:
         keywords = obj.keywords
         body = obj.body
         decorator_list = obj.decorator_list
-        tags = {Tag.CLASS}
+        tags = Tag.CLASS
 
         keep_definitions = self.is_match(self.config.keep_definitions, parent, tags, name=name)
         if not keep_definitions and name not in self.used_names:
-            self.logger.ignore_disabled(f"Pruning class {name}")
+            if self.logger.debug:
+                self.logger.ignore_disabled(f"Pruning class {name}")
             return
 
-        this = parent.add_child(*tags)
+        this = parent.add_child_tag(tags)
 
         # decorators
-        decorators_unparsed = [self.unparse(decorator) for decorator in decorator_list]
-        for decorator in decorators_unparsed:
-            this.add_line(f"@{decorator}")
+        this.extend_lines(f"@{self.unparse(decorator)}" for decorator in decorator_list)
 
         # generics
         generics = ""
@@ -372,7 +441,7 @@ class Stubber:
         self.check_body_ellipsis(parent, this, name=name)
 
         # we add an empty line as a spacer after every function
-        parent.add_child(Tag.SPACER).add_line("")
+        parent.add_child_tag(Tag.SPACER).add_line("")
 
     # pylint: disable-next=too-many-locals
     def stub_func(self, parent: Node, obj: ast.FunctionDef | ast.AsyncFunctionDef):
@@ -383,22 +452,21 @@ class Stubber:
         returns: ast.expr | None = obj.returns
         type_comment: str | None = obj.type_comment
         is_async_func: bool = isinstance(obj, ast.AsyncFunctionDef)
-        tags = {Tag.FUNCTION}
+        tags = Tag.FUNCTION
 
         if not self.is_match(self.config.keep_definitions, parent, tags, name=name):
-            self.logger.ignore_disabled(f"Pruning function {name}")
+            if self.logger.debug:
+                self.logger.ignore_disabled(f"Pruning function {name}")
             return
 
         # commit to emitting a function
-        this = parent.add_child(*tags)
+        this = parent.add_child_tag(tags)
 
         if type_comment:
             self.logger.ignore_unhandled("Type comment on function")
 
         # decorators
-        decorators_unparsed = [self.unparse(decorator) for decorator in decorator_list]
-        for decorator in decorators_unparsed:
-            this.add_line(f"@{decorator}")
+        this.extend_lines(f"@{self.unparse(decorator)}" for decorator in decorator_list)
 
         # generics
         generics = ""
@@ -427,7 +495,7 @@ class Stubber:
         # check if we have assignment statements, and inject them into
         # the surrounding class
         if (
-            Tag.CLASS in parent.tags
+            parent.tags & Tag.CLASS
             and name == "__init__"
             and self.is_match(self.config.add_class_attributes_from_init, parent, tags)
         ):
@@ -437,7 +505,7 @@ class Stubber:
         self.check_body_ellipsis(parent, this, name=name)
 
         # we add an empty line as a spacer after every function
-        parent.add_child(Tag.SPACER).add_line("")
+        parent.add_child_tag(Tag.SPACER).add_line("")
 
     def stub_expr(self, parent: Node, obj: ast.Expr):
         match obj.value:
@@ -455,8 +523,8 @@ class Stubber:
 
                 if keep_docstring:
                     raw_lit = self.source.unparse_original_source(obj)
-                    parent.add_child(Tag.DOCSTRING).add_line(raw_lit, allow_multiline=True)
-            case ast.Constant() if any(isinstance(obj.value.value, t) for t in CONSTANT_TYPES):
+                    parent.add_child_tag(Tag.DOCSTRING).add_line(raw_lit, allow_multiline=True)
+            case ast.Constant() if isinstance(obj.value.value, CONSTANT_TYPES):
                 self.log_stub_ignore(obj)
             case _:
                 self.log_stub_ignore(obj)
@@ -466,7 +534,7 @@ class Stubber:
         test = obj.test
         test_unparsed = self.unparse(test)
 
-        tags = {Tag.IF}
+        tags = Tag.IF
 
         # lines guarded by "TYPE_CHECKING" are treated transparently
         skip_first_body = False
@@ -478,7 +546,7 @@ class Stubber:
 
         # we then emit the if itself with removed bodies
         if self.is_match(self.config.keep_if_statements, parent, tags=tags):
-            this = parent.add_child(*tags)
+            this = parent.add_child_tag(tags)
             this.add_line(f"if {test_unparsed}:")
 
             if not skip_first_body:
@@ -493,7 +561,7 @@ class Stubber:
                 test = orelse[0].test
                 test_unparsed = self.unparse(test)
 
-                this = parent.add_child(*tags)
+                this = parent.add_child_tag(tags)
                 this.add_line(f"elif {test_unparsed}:")
 
                 for child in orelse[0].body:
@@ -504,7 +572,7 @@ class Stubber:
 
             # handle any final else
             if orelse:
-                this = parent.add_child(*tags)
+                this = parent.add_child_tag(tags)
                 this.add_line("else:")
                 for child in orelse:
                     self.stub(this, child)
@@ -532,13 +600,15 @@ class Stubber:
         def stub_type_alias(self, parent: Node, obj: ast.TypeAlias):
             generics = self.unparse_type_params(obj.type_params)
             unparsed = f"type {obj.name.id}{generics} = {self.unparse_type_expr(obj.value)}"
-            parent.add_child(Tag.TYPE_ALIAS).add_line(unparsed)
+            parent.add_child_tag(Tag.TYPE_ALIAS).add_line(unparsed)
 
     def check_body_ellipsis(self, parent: Node, this: Node, name: str | None = None):
         if not this.children:
-            this.add_child(Tag.ELLIPSIS).add_line("...")
+            this.add_child_tag(Tag.ELLIPSIS).add_line("...")
+        elif self._never_add_redundant_ellipsis:
+            pass
         elif self.is_match(self.config.add_redundant_ellipsis, parent, this.tags, children=this.children, name=name):
-            this.add_child(Tag.ELLIPSIS).add_line("...")
+            this.add_child_tag(Tag.ELLIPSIS).add_line("...")
 
     def check_add_class_attributes(self, parent: Node, body: list[ast.stmt]):
         for body_stmt in body:
@@ -559,11 +629,11 @@ class Stubber:
             insert_pos = 0
             already_inserted = False
             for parent_child_idx, parent_child in enumerate(parent.children):
-                if Tag.VARIABLE in parent_child.tags:
+                if parent_child.tags & Tag.VARIABLE:
                     insert_pos = parent_child_idx + 1
                     if parent_child.meta["name"] == attr:
                         already_inserted = True
-                elif Tag.DOCSTRING in parent_child.tags:
+                elif parent_child.tags & Tag.DOCSTRING:
                     insert_pos = parent_child_idx + 1
 
             if not already_inserted:
@@ -576,10 +646,15 @@ class Stubber:
                     parent.children.insert(insert_pos, child_node)
 
     def log_stub_ignore(self, obj: ast.AST):
-        self.logger.ignore_intentional(f"{type(obj).__name__} statement")
+        if self.logger.debug:
+            self.logger.ignore_intentional(f"{type(obj).__name__} statement")
 
     def unparse(self, obj: ast.AST) -> str:
-        return self.source.unparse(obj)
+        cached = self._unparse_cache.get(id(obj))
+        if cached is None:
+            cached = (obj, self.source.unparse(obj))
+            self._unparse_cache[id(obj)] = cached
+        return cached[1]
 
     # pylint: disable-next=too-many-return-statements
     def unparse_type_expr(self, expr: ast.expr) -> str:
@@ -619,30 +694,19 @@ class Stubber:
         kwarg = ast_args.kwarg
         defaults = ast_args.defaults
 
-        def_counter = 0
-        kw_def_counter = 0
-
-        # the defaults variables contains the last N defaults, but for convenience
-        # we compute an list where the initial skipped values are mapped to None
-        aligned_defaults: list[None | ast.expr] = [None] * (len(posonlyargs) + len(args))
-        gap = len(aligned_defaults) - len(defaults)
-        aligned_defaults[gap:] = defaults
+        # the defaults variables contains the last N defaults, so the first `gap`
+        # positional arguments have no default value
+        gap = len(posonlyargs) + len(args) - len(defaults)
 
         unparsed_args: list[str] = []
         if posonlyargs:
-            for arg in posonlyargs:
-                val: ast.expr | None = None
-                val = aligned_defaults[def_counter]
-                def_counter += 1
-
+            for i, arg in enumerate(posonlyargs):
+                val = defaults[i - gap] if i >= gap else None
                 unparsed_args.append(self.unparse_arg(arg, val))
             unparsed_args.append("/")
 
-        for arg in args:
-            val: ast.expr | None = None
-            val = aligned_defaults[def_counter]
-            def_counter += 1
-
+        for i, arg in enumerate(args, start=len(posonlyargs)):
+            val = defaults[i - gap] if i >= gap else None
             unparsed_args.append(self.unparse_arg(arg, val))
 
         kwonlyargs_started = False
@@ -654,11 +718,7 @@ class Stubber:
         if kwonlyargs:
             if not kwonlyargs_started:
                 unparsed_args.append("*")
-            for arg in kwonlyargs:
-                val: ast.expr | None = None
-                val = kw_defaults[kw_def_counter]
-                kw_def_counter += 1
-
+            for arg, val in zip(kwonlyargs, kw_defaults):
                 unparsed_args.append(self.unparse_arg(arg, val))
 
         if kwarg is not None:
@@ -671,33 +731,32 @@ class Stubber:
         # pylint: disable-next=no-member
         def unparse_type_params(self, type_params: ast.type_param) -> str:
             generics = ""
-            if sys.version_info >= (3, 12):
-                type_params_unparsed = []
-                for type_param in type_params:
-                    name = ""
-                    bounds = ""
-                    default = ""
-
-                    match type_param:
-                        # pylint: disable-next=no-member
-                        case ast.TypeVar():
-                            name = f"{type_param.name}"
-                            if type_param.bound is not None:
-                                bounds = f": {self.unparse_type_expr(type_param.bound)}"
-                        # pylint: disable-next=no-member
-                        case ast.TypeVarTuple():
-                            name = f"*{type_param.name}"
-                        # pylint: disable-next=no-member
-                        case ast.ParamSpec():
-                            name = f"**{type_param.name}"
-
-                    if sys.version_info >= (3, 13) and type_param.default_value is not None:
-                        default = f" = {self.unparse_type_expr(type_param.default_value)}"
-
-                    type_params_unparsed.append(f"{name}{bounds}{default}")
-
-                if type_params_unparsed:
-                    generics = f"[{', '.join(type_params_unparsed)}]"
+            type_params_unparsed: list[str] = []
+            for type_param in type_params:
+                name = ""
+                bounds = ""
+                default = ""
+
+                match type_param:
+                    # pylint: disable-next=no-member
+                    case ast.TypeVar():
+                        name = f"{type_param.name}"
+                        if type_param.bound is not None:
+                            bounds = f": {self.unparse_type_expr(type_param.bound)}"
+                    # pylint: disable-next=no-member
+                    case ast.TypeVarTuple():
+                        name = f"*{type_param.name}"
+                    # pylint: disable-next=no-member
+                    case ast.ParamSpec():
+                        name = f"**{type_param.name}"
+
+                if sys.version_info >= (3, 13) and type_param.default_value is not None:
+                    default = f" = {self.unparse_type_expr(type_param.default_value)}"
+
+                type_params_unparsed.append(f"{name}{bounds}{default}")
+
+            if type_params_unparsed:
+                generics = f"[{', '.join(type_params_unparsed)}]"
             return generics
 
     # pylint: disable-next=too-many-arguments
@@ -705,7 +764,7 @@ class Stubber:
         self,
         pattern: str | bool | None,
         parent: Node,
-        tags: set[Tag],
+        tags: Tag,
         *,
         name: str | None = None,
         annotation: str | None = None,
@@ -713,11 +772,16 @@ class Stubber:
         children: list[Node] | None = None,
     ) -> bool:
 
-        child_tags: set[Tag] | None = None
+        child_mask: Tag | None = None
         if children:
-            child_tags = set()
+            child_mask = Tag(0)
             for child in children:
-                child_tags.update(child.tags)
+                child_mask |= child.tags
+
+        key = (pattern, parent.tags, tags, name, annotation, value, child_mask)
+        cached = self._match_cache.get(key)
+        if cached is not None:
+            return cached
 
         ctx = MatchContext(
             parent_tags=parent.tags,
@@ -726,27 +790,107 @@ class Stubber:
             name=name,
             annotation=annotation,
             value=value,
-            child_tags=child_tags,
+            child_tags=child_mask,
         )
-        return self.config.get_pattern(pattern).is_match(ctx)
+        ret = self.config.get_pattern(pattern).is_match(ctx)
+        self._match_cache[key] = ret
+        return ret
+
+
+@lru_cache(maxsize=None)
+def _dubstub_version() -> str:
+    try:
+        return version("dubstub")
+    except PackageNotFoundError:
+        return "unknown"
 
 
-def _stub_content(inp: str, relative_path: Path, config: ValidatedConfig, used_names: set[str]) -> str:
+def _parse_module_cached(source: Source, config: ValidatedConfig) -> ast.Module:
+    """
+    Parse the module of `source`, using the on-disk cache in `ast_cache_dir` if enabled.
+
+    The parse result only depends on the source text, the parser options,
+    the python interpreter and dubstub itself, so those make up the cache key.
+    The cache is best-effort, so failing to read or write it never fails the stubbing.
+    """
+
+    if not config.ast_cache_dir:
+        return source.parse_module()
+
+    digest = sha256()
+    digest.update(
+        repr((sys.version, _dubstub_version(), source.config.feature_version, source.config.type_comments)).encode()
+    )
+    digest.update(source.src)
+    cache_path = Path(config.ast_cache_dir) / f"{digest.hexdigest()}.pickle"
+
+    cached: object = None
+    try:
+        with cache_path.open("rb") as cache_file:
+            cached = pickle.load(cache_file)
+    except FileNotFoundError:
+        pass
+    except Exception:  # pylint: disable=broad-exception-caught
+        # NB: truncated or stale entries can fail to load in many ways, all of them count as a miss
+        _unlink_quietly(cache_path)
+
+    if isinstance(cached, ast.Module):
+        return cached
+    if cached is not None:
+        _unlink_quietly(cache_path)
+
+    module = source.parse_module()
+
+    # write to a temporary file first, so that concurrent runs never see a partial entry
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_bytes(pickle.dumps(module, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp_path.replace(cache_path)
+    except OSError:
+        _unlink_quietly(tmp_path)
+
+    return module
+
+
+def _unlink_quietly(path: Path):
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _stub_content(
+    inp: str,
+    relative_path: Path,
+    config: ValidatedConfig,
+    used_names: set[str],
+    match_cache: dict[MatchKey, bool] | None = None,
+) -> str:
     source = Source(inp, relative_path, AstConfig(feature_version=config.get_python_version()))
-    ast_module = source.parse_module()
-    stubber = Stubber(source, config, used_names)
+    ast_module = _parse_module_cached(source, config)
+    stubber = Stubber(source, config, used_names, match_cache)
     return stubber.output(ast_module)
 
 
 def stubgen_single_file_src(inp: str, relative_path: Path, config: ValidatedConfig) -> str:
     used_names: set[str] = set()
 
+    # If neither imports nor definitions can get pruned, the set of used names
+    # has no influence on the output, and a single pass is enough.
+    if (
+        config.get_pattern(config.keep_unused_imports).is_always_true()
+        and config.get_pattern(config.keep_definitions).is_always_true()
+    ):
+        return _stub_content(inp, relative_path, config, used_names)
+
     # Repeatedly stub the module until the set of discovered names no longer increases.
     # Usually this means at least two iterations.
     stubbed: str | None = None
     iteration_counter = 0
+    match_cache: dict[MatchKey, bool] = {}
     while True:
-        stubbed = _stub_content(inp, relative_path, config, used_names)
+        stubbed = _stub_content(inp, relative_path, config, used_names, match_cache)
         discovered_names = discover_used_names(stubbed, relative_path, config)
 
         # check if we discovered any new name
@@ -787,9 +931,15 @@ def discover_used_names(stubbed: str, relative_path: Path, config: ValidatedConf
 
 
 def _discover_any_names(obj: ast.AST, out_discovered_names: set[str]):
-    for node in ast.walk(obj):
+    # NB: An explicit stack is cheaper than `ast.walk()`, and lets us skip
+    # descending into the names themselves.
+    stack = [obj]
+    while stack:
+        node = stack.pop()
         if isinstance(node, ast.Name):
             out_discovered_names.add(node.id)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
 
 
 def _discover_special_assign_names(
@@ -832,7 +982,9 @@ def _unparse_type_expr(source: Source, expr: ast.expr) -> str:
 
     match expr:
         case ast.Subscript(value, slc, ast.Load()):
-            prefix = source.unparse(value)
+            prefix = _unparse_dotted_name(value)
+            if prefix is None:
+                prefix = source.unparse(value)
             if prefix == "Literal":
                 return source.unparse_original_source(expr)
 
@@ -863,11 +1015,36 @@ def _unparse_type_expr(source: Source, expr: ast.expr) -> str:
                 return source.unparse(source.parse_expr(value))
             except SyntaxError:
                 return source.unparse(expr)
+        case ast.Name(name):
+            return name
         case _:
             # return unchanged
             return source.unparse(expr)
 
 
+def _unparse_dotted_name(expr: ast.expr) -> str | None:
+    """
+    Cheaply unparse plain names like `foo` or `foo.bar.baz`, which make up
+    most type expressions.
+
+    Returns `None` for anything else.
+    """
+
+    if isinstance(expr, ast.Name):
+        return expr.id
+
+    attrs: list[str] = []
+    while isinstance(expr, ast.Attribute):
+        attrs.append(expr.attr)
+        expr = expr.value
+
+    if not attrs or not isinstance(expr, ast.Name):
+        return None
+
+    attrs.append(expr.id)
+    return ".".join(reversed(attrs))
+
+
 def _as_string_constant(obj: ast.AST) -> str | None:
     if isinstance(obj, ast.Expr):
         obj = obj.value
@@ -6,7 +6,7 @@ from typing import TypeAlias
 SpannedNode: TypeAlias = ast.stmt | ast.expr
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AstConfig:
     feature_version: tuple[int, int] | None = None
     type_comments: bool = False
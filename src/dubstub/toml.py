@@ -1,6 +1,8 @@
 from tomli_w import dumps as dumps  # pylint: disable=unused-import
 
 try:
+    from tomli import load as load  # pylint: disable=unused-import
     from tomli import loads as loads  # pylint: disable=unused-import
 except ImportError:
+    from tomllib import load as load  # type: ignore
     from tomllib import loads as loads  # type: ignore
@@ -1,17 +1,47 @@
+import os
 import re
 import sys
 from contextlib import contextmanager
-from typing import Mapping, Sequence, TypeAlias
+from functools import lru_cache
+from importlib import import_module
+from typing import Any, Mapping, Sequence, TypeAlias
 
 Json: TypeAlias = Mapping[str, "Json"] | Sequence["Json"] | str | int | float | bool | None
 
+# Set `DUBSTUB_DEBUG` to anything but empty or `0` to get additional diagnostics
+DEBUG = os.environ.get("DUBSTUB_DEBUG", "") not in ("", "0")
+
+
+def _import_re2() -> Any:
+    # NB: `google-re2` is an optional, faster regex engine without backtracking
+    try:
+        return import_module("re2")
+    except ImportError:
+        return None
+
+
+_RE2 = _import_re2()
+
+
+@lru_cache(maxsize=512)
+def compile_regex(pattern: str) -> re.Pattern[str]:
+    if _RE2 is not None:
+        try:
+            return _RE2.compile(pattern)
+        except _RE2.error:
+            # re2 does not support all of the syntax of `re`, like lookarounds
+            pass
+
+    return re.compile(pattern)
+
 
 def regex_match(pattern: str, strings: str | list[str]) -> bool:
     if isinstance(strings, str):
         strings = [strings]
 
+    fullmatch = compile_regex(pattern).fullmatch
     for string in strings:
-        if re.fullmatch(pattern, string):
+        if fullmatch(string):
             return True
 
     return False
@@ -1,3 +1,20 @@
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Generator
 
 TESTDATA = Path(__file__).parent / "data_for_test"
+
+
+@contextmanager
+def raises_contains(exc_type: type[BaseException], substr: str) -> Generator[None, None, None]:
+    """
+    Like `pytest.raises(exc_type, match=...)`, but checks for a plain substring
+    of the exception message instead of a regex.
+    """
+
+    try:
+        yield
+    except exc_type as exc:
+        assert substr in str(exc), f"{substr!r} not found in {str(exc)!r}"
+    else:
+        raise AssertionError(f"expected {exc_type.__name__} to be raised")
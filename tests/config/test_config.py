@@ -1,65 +1,86 @@
-import re
+import ast
 from pathlib import Path
 
 import pytest
 
-from dubstub import toml
-from dubstub.config import Config
-from dubstub.config.match_ctx import MatchContext, Tag
-from dubstub.config.pattern import Pattern, parse_pattern
+from dubstub import generate_stubs, toml
+from dubstub.config import Config, FormatterCmd
+from dubstub.config.match_ctx import MatchContext, Tag, tag_set
+from dubstub.config.pattern import (
+    FALSE_PATTERN,
+    TRUE_PATTERN,
+    Pattern,
+    always_false,
+    always_true,
+    literal_tags,
+    merge_literal_calls,
+    parse_pattern,
+)
 from dubstub.util import regex_match
 
+from .. import raises_contains
+
 CONTEXT = MatchContext(
-    parent_tags={Tag.CLASS},
-    tags={Tag.IF},
+    parent_tags=Tag.CLASS,
+    tags=Tag.IF,
     file_path="foo/bar",
     name="qux",
     annotation="&str",
     value="PhantomData",
-    child_tags={Tag.MODULE},
+    child_tags=Tag.MODULE,
 )
 
 
-@pytest.mark.parametrize(
-    "pattern",
-    [
-        Pattern(True),
-        Pattern('parent_node_is("class")'),
-        Pattern('parent_node_is("cl.ss")'),
-        Pattern('node_is("if")'),
-        Pattern('node_is("i.")'),
-        Pattern('name_is("qux")'),
-        Pattern('name_is("q.x")'),
-        Pattern('file_path_is("foo/bar")'),
-        Pattern('file_path_is(".*/bar")'),
-        Pattern('file_path_is("foo/.*")'),
-        Pattern('annotation_is("&str")'),
-        Pattern('annotation_is(".str")'),
-        Pattern('value_is("PhantomData")'),
-        Pattern('value_is(".*Data")'),
-        Pattern('any_child_node_is("module")'),
-        Pattern('any_child_node_is("mod.*e")'),
-    ],
-)
-def test_pattern_matches(pattern: Pattern):
-    assert pattern.is_match(CONTEXT)
+MATCHING_PATTERNS: list[bool | str] = [
+    True,
+    'parent_node_is("class")',
+    'parent_node_is("cl.ss")',
+    'node_is("if")',
+    'node_is("i.")',
+    'name_is("qux")',
+    'name_is("q.x")',
+    'file_path_is("foo/bar")',
+    'file_path_is(".*/bar")',
+    'file_path_is("foo/.*")',
+    'annotation_is("&str")',
+    'annotation_is(".str")',
+    'value_is("PhantomData")',
+    'value_is(".*Data")',
+    'any_child_node_is("module")',
+    'any_child_node_is("mod.*e")',
+]
 
+NON_MATCHING_PATTERNS: list[bool | str] = [
+    'parent_node_is("o")',
+    'node_is("a")',
+    'name_is("u")',
+    'file_path_is("abc/.*")',
+    'file_path_is("foo/_.*")',
+    'annotation_is("x")',
+    'value_is("y")',
+    'any_child_node_is("z")',
+]
 
-@pytest.mark.parametrize(
-    "pattern",
-    [
-        Pattern('parent_node_is("o")'),
-        Pattern('node_is("a")'),
-        Pattern('name_is("u")'),
-        Pattern('file_path_is("abc/.*")'),
-        Pattern('file_path_is("foo/_.*")'),
-        Pattern('annotation_is("x")'),
-        Pattern('value_is("y")'),
-        Pattern('any_child_node_is("z")'),
-    ],
-)
-def test_pattern_no_matches(pattern: Pattern):
-    assert not pattern.is_match(CONTEXT)
+
+def test_pattern_matches():
+    for i, raw in enumerate(MATCHING_PATTERNS):
+        if not Pattern(raw).is_match(CONTEXT):
+            pytest.fail(f"pattern {i} ({raw!r}) did not match")
+
+
+def test_pattern_no_matches():
+    for i, raw in enumerate(NON_MATCHING_PATTERNS):
+        if Pattern(raw).is_match(CONTEXT):
+            pytest.fail(f"pattern {i} ({raw!r}) matched")
+
+
+def test_pattern_is_match_many():
+    contexts = [CONTEXT, MatchContext(Tag(0), Tag.CLASS, "", "foo")]
+
+    assert Pattern("node_is('if')").is_match_many(contexts) == [True, False]
+    assert Pattern("name_is('foo') or parent_node_is('class')").is_match_many(contexts) == [True, True]
+    assert Pattern(False).is_match_many(contexts) == [False, False]
+    assert Pattern(True).is_match_many([]) == []
 
 
 def test_default_private_name_re():
@@ -106,33 +127,33 @@ def test_parse_valid_pattern2(pattern: str | bool):
     [
         pytest.param(
             "42",
-            re.escape("unsupported constant type: int"),
+            "unsupported constant type: int",
             id="wrong-const-type",
         ),
         pytest.param(
             "foo.bar('')",
-            re.escape("unsupported function syntax"),
+            "unsupported function syntax",
             id="wrong-call-type",
         ),
         pytest.param(
             "bar('')",
-            re.escape("unsupported function name"),
+            "unsupported function name",
             id="wrong-call-name",
         ),
         pytest.param(
             "node_is('', x=y)",
-            re.escape("unsupported function signature"),
+            "unsupported function signature",
             id="wrong-call-sig",
         ),
         pytest.param(
             "node_is(42)",
-            re.escape("unsupported function argument"),
+            "unsupported function argument",
             id="wrong-call-arg",
         ),
     ],
 )
 def test_parse_invalid_pattern2(pattern: str | bool, message: str):
-    with pytest.raises(ValueError, match=message):
+    with raises_contains(ValueError, message):
         parse_pattern(pattern)
 
 
@@ -140,36 +161,50 @@ def test_parse_invalid_pattern2(pattern: str | bool, message: str):
     ("pattern", "ctx", "expected"),
     [
         # simple case
-        (True, MatchContext(set(), set(), "", None), True),
-        ("True", MatchContext(set(), set(), "", None), True),
-        (False, MatchContext(set(), set(), "", None), False),
-        ("False", MatchContext(set(), set(), "", None), False),
+        (True, MatchContext(Tag(0), Tag(0), "", None), True),
+        ("True", MatchContext(Tag(0), Tag(0), "", None), True),
+        (False, MatchContext(Tag(0), Tag(0), "", None), False),
+        ("False", MatchContext(Tag(0), Tag(0), "", None), False),
         # parent
-        ("parent_node_is('class')", MatchContext({Tag.CLASS}, set(), "", None), True),
-        ("parent_node_is('class')", MatchContext({Tag.IF}, set(), "", None), False),
+        ("parent_node_is('class')", MatchContext(Tag.CLASS, Tag(0), "", None), True),
+        ("parent_node_is('class')", MatchContext(Tag.IF, Tag(0), "", None), False),
         # node
-        ("node_is('class')", MatchContext(set(), {Tag.CLASS}, "", None), True),
-        ("node_is('class')", MatchContext(set(), {Tag.IF}, "", None), False),
+        ("node_is('class')", MatchContext(Tag(0), Tag.CLASS, "", None), True),
+        ("node_is('class')", MatchContext(Tag(0), Tag.IF, "", None), False),
         # path
-        ("file_path_is('/foo.*')", MatchContext(set(), set(), "/foo/bar", None), True),
-        ("file_path_is('/foo.*')", MatchContext(set(), set(), "/bar/foo", None), False),
+        ("file_path_is('/foo.*')", MatchContext(Tag(0), Tag(0), "/foo/bar", None), True),
+        ("file_path_is('/foo.*')", MatchContext(Tag(0), Tag(0), "/bar/foo", None), False),
         # name
-        ("name_is('foo')", MatchContext(set(), set(), "", "foo"), True),
-        ("name_is('foo')", MatchContext(set(), set(), "", "bar"), False),
-        ("name_is('foo')", MatchContext(set(), set(), "", None), False),
+        ("name_is('foo')", MatchContext(Tag(0), Tag(0), "", "foo"), True),
+        ("name_is('foo')", MatchContext(Tag(0), Tag(0), "", "bar"), False),
+        ("name_is('foo')", MatchContext(Tag(0), Tag(0), "", None), False),
         # complex and
-        ("node_is('class') and name_is('foo')", MatchContext(set(), {Tag.CLASS}, "", "foo"), True),
-        ("node_is('class') and name_is('foo')", MatchContext(set(), {Tag.CLASS}, "", "bar"), False),
-        ("node_is('class') and name_is('foo')", MatchContext(set(), {Tag.IF}, "", "foo"), False),
+        ("node_is('class') and name_is('foo')", MatchContext(Tag(0), Tag.CLASS, "", "foo"), True),
+        ("node_is('class') and name_is('foo')", MatchContext(Tag(0), Tag.CLASS, "", "bar"), False),
+        ("node_is('class') and name_is('foo')", MatchContext(Tag(0), Tag.IF, "", "foo"), False),
         # complex or
-        ("node_is('class') or name_is('foo')", MatchContext(set(), {Tag.CLASS}, "", "foo"), True),
-        ("node_is('class') or name_is('foo')", MatchContext(set(), {Tag.CLASS}, "", "bar"), True),
-        ("node_is('class') or name_is('foo')", MatchContext(set(), {Tag.IF}, "", "foo"), True),
+        ("node_is('class') or name_is('foo')", MatchContext(Tag(0), Tag.CLASS, "", "foo"), True),
+        ("node_is('class') or name_is('foo')", MatchContext(Tag(0), Tag.CLASS, "", "bar"), True),
+        ("node_is('class') or name_is('foo')", MatchContext(Tag(0), Tag.IF, "", "foo"), True),
         # tag or
-        ("node_is('class|if')", MatchContext(set(), {Tag.IF}, "", None), True),
-        ("node_is('class|if')", MatchContext(set(), {Tag.CLASS}, "", None), True),
-        ("node_is('class|if')", MatchContext(set(), {Tag.IF, Tag.CLASS}, "", None), True),
-        ("node_is('class|if')", MatchContext(set(), {Tag.IF, Tag.CLASS, Tag.MODULE}, "", None), True),
+        ("node_is('class|if')", MatchContext(Tag(0), Tag.IF, "", None), True),
+        ("node_is('class|if')", MatchContext(Tag(0), Tag.CLASS, "", None), True),
+        ("node_is('class|if')", MatchContext(Tag(0), Tag.IF | Tag.CLASS, "", None), True),
+        ("node_is('class|if')", MatchContext(Tag(0), Tag.IF | Tag.CLASS | Tag.MODULE, "", None), True),
+        # nested
+        ("not (node_is('class') and name_is('foo'))", MatchContext(Tag(0), Tag.CLASS, "", "foo"), False),
+        ("not (node_is('class') and name_is('foo'))", MatchContext(Tag(0), Tag.IF, "", "foo"), True),
+        ("(node_is('if') or name_is('foo')) and not file_path_is('x')", MatchContext(Tag(0), Tag(0), "", "foo"), True),
+        (
+            "(node_is('if') or name_is('foo')) and not file_path_is('x')",
+            MatchContext(Tag(0), Tag(0), "x", "foo"),
+            False,
+        ),
+        ("(node_is('if') or name_is('foo')) and not file_path_is('x')", MatchContext(Tag(0), Tag(0), "", "bar"), False),
+        ("False or not True or name_is('foo') and True", MatchContext(Tag(0), Tag(0), "", "foo"), True),
+        # merged or
+        ("name_is('foo') or node_is('if') or name_is('bar')", MatchContext(Tag(0), Tag(0), "", "bar"), True),
+        ("name_is('foo') or node_is('if') or name_is('bar')", MatchContext(Tag(0), Tag(0), "", "foobar"), False),
     ],
 )
 def test_eval_pattern2(pattern: str | bool, ctx: MatchContext, expected: bool):
@@ -177,6 +212,96 @@ def test_eval_pattern2(pattern: str | bool, ctx: MatchContext, expected: bool):
     assert matcher(ctx) == expected
 
 
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        ("node_is('class') or node_is('if')", ["node_is('class|if')"]),
+        (
+            "node_is('class') or name_is('foo') or node_is('if') or name_is('bar')",
+            ["node_is('class|if')", "name_is('foo|bar')"],
+        ),
+        ("name_is('foo') or name_is('b.r') or True", ["name_is('foo')", "name_is('b.r')", "True"]),
+        ("name_is('foo') or node_is('class')", ["name_is('foo')", "node_is('class')"]),
+    ],
+)
+def test_merge_literal_calls(pattern: str, expected: list[str]):
+    _, parsed = parse_pattern(pattern)
+    assert isinstance(parsed.body, ast.BoolOp)
+
+    assert [ast.unparse(value) for value in merge_literal_calls(parsed.body.values)] == expected
+
+
+def test_pattern_is_interned():
+    assert Pattern("node_is('class')") is Pattern("node_is('class')")
+    assert Pattern(True) is Pattern(True)
+    assert Pattern(True) is not Pattern("True")
+
+
+def test_constant_pattern_matcher():
+    assert Pattern(True) is TRUE_PATTERN
+    assert Pattern(False) is FALSE_PATTERN
+    assert Pattern("not (True or name_is('foo'))").pattern is always_false
+    assert Pattern("True or name_is('foo')").pattern is always_true
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        (True, True),
+        ("True", True),
+        ("not False", True),
+        ("True or node_is('class')", True),
+        ("node_is('class') or not False", True),
+        ("not (False and name_is('foo'))", True),
+        (False, False),
+        ("node_is('.*')", False),
+        ("True and node_is('class')", False),
+        ("not True or name_is('foo')", False),
+    ],
+)
+def test_pattern_is_always_true(pattern: str | bool, expected: bool):
+    assert Pattern(pattern).is_always_true() == expected
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        (False, True),
+        ("False", True),
+        ("not True", True),
+        ("False and node_is('class')", True),
+        ("not (True or name_is('foo'))", True),
+        (True, False),
+        ("node_is('.*')", False),
+        ("False or node_is('class')", False),
+    ],
+)
+def test_pattern_is_always_false(pattern: str | bool, expected: bool):
+    assert Pattern(pattern).is_always_false() == expected
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        ("class", Tag.CLASS),
+        ("class|if", Tag.CLASS | Tag.IF),
+        ("type_alias", Tag.TYPE_ALIAS),
+        ("cl.ss", None),
+        ("class|.*", None),
+        ("foo", None),
+        ("", None),
+    ],
+)
+def test_literal_tags(pattern: str, expected: Tag | None):
+    assert literal_tags(pattern) == expected
+
+
+def test_tag_set():
+    assert tag_set(Tag(0)) == frozenset()
+    assert tag_set(Tag.CLASS | Tag.IF) == frozenset({Tag.CLASS, Tag.IF})
+    assert tag_set(Tag.CLASS | Tag.IF) is tag_set(Tag.IF | Tag.CLASS)
+
+
 CONFIG_TOML = r"""
 [tool.dubstub]
 profile = "pyright"
@@ -210,3 +335,72 @@ def test_parse_path(tmp_path: Path):
     assert config.profile == "pyright"
     assert config.keep_definitions is not None
     assert config.keep_definitions == "True or False"
+
+
+def test_parse_path_modified(tmp_path: Path):
+    (tmp_path / "config.toml").write_text(CONFIG_TOML)
+    config = Config.parse_config(path=tmp_path / "config.toml")
+    assert config.keep_definitions == "True or False"
+
+    (tmp_path / "config.toml").write_text(CONFIG_TOML.replace("True or False", "False or True or False"))
+    config = Config.parse_config(path=tmp_path / "config.toml")
+    assert config.keep_definitions == "False or True or False"
+
+
+def test_validate_unknown_profile():
+    with raises_contains(ValueError, "unknown profile foo"):
+        Config(profile="foo").validate()
+
+
+def test_validate_cached():
+    config = Config(keep_definitions=True)
+
+    assert config.fingerprint() == Config(keep_definitions=True).fingerprint()
+    assert config.fingerprint() != Config(keep_definitions=False).fingerprint()
+
+    validated = config.validate_cached()
+    assert validated.fingerprint() == config.validate().fingerprint()
+    assert validated.fingerprint() != Config(keep_definitions=False).validate_cached().fingerprint()
+
+    # every caller gets its own copy, so modifying it does not leak into later calls
+    validated.keep_definitions = False
+    assert Config(keep_definitions=True).validate_cached().keep_definitions is True
+
+
+def test_from_fingerprint():
+    config = Config(keep_definitions=True, formatter_cmds=[FormatterCmd("foo", ["foo", "${dubstub_file_args}"])])
+    assert Config.from_fingerprint(config.fingerprint()) == config
+
+
+FORMATTER_TOML = r"""
+[tool.dubstub]
+format = true
+
+[[tool.dubstub.formatter_cmds]]
+name = "mark"
+cmdline = [
+    "${dubstub_py_exe}",
+    "-c",
+    "import sys; [open(p, 'a').write('# formatted\\n') for p in sys.argv[1:]]",
+    "${dubstub_file_args}",
+]
+"""
+
+
+def test_parse_formatter_cmds(tmp_path: Path):
+    (tmp_path / "pyproject.toml").write_text(FORMATTER_TOML)
+    (tmp_path / "inp").mkdir()
+    (tmp_path / "inp" / "foo.py").write_text("x: int = 1\n")
+
+    config = Config.parse_config(path=tmp_path / "pyproject.toml")
+    assert config.formatter_cmds is not None
+    assert [cmd.name for cmd in config.formatter_cmds] == ["mark"]
+
+    generate_stubs(tmp_path / "inp", tmp_path / "out", config)
+
+    assert (tmp_path / "out" / "foo.pyi").read_text().endswith("# formatted\n")
+
+
+def test_parse_formatter_cmds_unknown_key():
+    with raises_contains(ValueError, "unknown formatter_cmds key foo"):
+        Config.parse_config(obj={"tool": {"dubstub": {"formatter_cmds": [{"name": "a", "cmdline": [], "foo": 1}]}}})
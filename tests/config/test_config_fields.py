@@ -1,64 +1,109 @@
+import ast
+import os
+import pickle
+import re
 import sys
+from dataclasses import dataclass, replace
+from functools import lru_cache
 from pathlib import Path
-from tempfile import TemporaryDirectory
 from textwrap import dedent
 
 import pytest
 
 from dubstub import generate_stubs
 from dubstub.config import Config, FormatterCmd
-from dubstub.config.show import fmt_config
+from dubstub.config.show import fmt_config_toml
+from dubstub.util import DEBUG
+
+EXPECTED_TEST_NAMES = frozenset(f"test_config_{field_name}" for field_name in Config.get_fields())
 
 
 def test_meta_configs():
-    expected_tests: set[str] = set()
-    for field_name in Config.get_fields():
-        expected_tests.add(f"test_config_{field_name}")
+    missing_tests = EXPECTED_TEST_NAMES - globals().keys()
+    assert not missing_tests, missing_tests
+
 
-    missing_tests = expected_tests - set(globals())
-    assert not missing_tests
+BLANK_LINE_RE = re.compile(r"^[ \t]*\n", re.MULTILINE)
 
 
+@lru_cache(maxsize=1024)
 def normalize_test_src(src: str) -> str:
-    return "\n".join(line for line in dedent(src).strip().splitlines() if line.strip())
+    return BLANK_LINE_RE.sub("", dedent(src).strip())
+
+
+@pytest.fixture(name="stubs_root", scope="session")
+def fixture_stubs_root(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """
+    A temporary directory shared by all test cases of a session.
+
+    Each case uses its own subdirectory, so nothing needs to be cleaned up in between.
+    """
+
+    return tmp_path_factory.mktemp("stubs")
+
+
+def stub_on_disk(tmp: Path, config: Config, inp: str, filename: str | list[str]) -> str:
+    (tmp / "input").mkdir(parents=True)
+    inp_bytes = inp.encode()
+
+    if isinstance(filename, str):
+        inp_path = tmp / "input" / filename
+        inp_path.write_bytes(inp_bytes)
+
+        out_path = (tmp / "output" / filename).with_suffix(".pyi")
 
+        generate_stubs(inp_path, out_path, config)
+        return out_path.read_bytes().decode()
 
-def config_helper(config: Config, inp: str, expected: str, filename: str | list[str] = "file.py"):
-    inp = normalize_test_src(inp)
-    expected = normalize_test_src(expected)
-    with TemporaryDirectory() as tmpdir:
-        tmp = Path(tmpdir)
+    inp_path = tmp / "input"
+    for fname in filename:
+        (inp_path / fname).write_bytes(inp_bytes)
 
-        (tmp / "input").mkdir()
-        (tmp / "output").mkdir()
+    out_path = tmp / "output"
 
-        if isinstance(filename, str):
-            inp_path = tmp / "input" / filename
-            inp_path.write_text(inp)
+    generate_stubs(inp_path, out_path, config)
 
-            out_path = (tmp / "output" / filename).with_suffix(".pyi")
+    chunks: list[str] = []
+    with os.scandir(out_path) as entries:
+        # NB: the directory listing order depends on the filesystem, so we sort it
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.is_file(follow_symlinks=False):
+                chunks.append(f"# {entry.name}\n")
+                chunks.append((out_path / entry.name).read_bytes().decode())
+                chunks.append("\n")
+    return "".join(chunks)
 
-            generate_stubs(inp_path, out_path, config)
-            stubbed = normalize_test_src(out_path.read_text())
-        else:
-            inp_path = tmp / "input"
-            for fname in filename:
-                (inp_path / fname).write_text(inp)
 
-            out_path = tmp / "output"
+@dataclass
+class ConfigHelper:
+    """
+    Stubs a source with a config and compares it with the expected output.
 
-            generate_stubs(inp_path, out_path, config)
+    Each call uses its own directory below `root`.
+    """
 
-            stubbed = ""
-            for out_path_file in out_path.iterdir():
-                if out_path_file.is_file():
-                    stubbed += f"# {out_path_file.name}\n"
-                    stubbed += out_path_file.read_text() + "\n"
+    root: Path
+    calls: int = 0
 
-            stubbed = normalize_test_src(stubbed)
+    def __call__(self, config: Config, inp: str, expected: str, filename: str | list[str] = "file.py"):
+        self.calls += 1
+        tmp = self.root / str(self.calls)
 
-    print(fmt_config(config.validate(), show_format="toml"))
-    assert stubbed == expected
+        inp = normalize_test_src(inp)
+        expected = normalize_test_src(expected)
+
+        stubbed = normalize_test_src(stub_on_disk(tmp, config, inp, filename))
+
+        if DEBUG:
+            print(fmt_config_toml(config.validate()))
+        assert stubbed == expected
+
+
+@pytest.fixture(name="config_helper")
+def fixture_config_helper(stubs_root: Path, request: pytest.FixtureRequest) -> ConfigHelper:
+    # NB: the test name includes the parameter ids, so it is unique for each case
+    name = str(request.node.name)  # type: ignore
+    return ConfigHelper(stubs_root / name)
 
 
 @pytest.mark.parametrize(
@@ -214,8 +259,8 @@ def config_helper(config: Config, inp: str, expected: str, filename: str | list[
         ),
     ],
 )
-def test_config_keep_definitions(config: Config, expected: str):
-    config.add_implicit_none_return = False
+def test_config_keep_definitions(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, add_implicit_none_return=False)
     config_helper(
         config,
         """
@@ -346,9 +391,8 @@ def test_config_keep_definitions(config: Config, expected: str):
         ),
     ],
 )
-def test_config_keep_trailing_docstrings(config: Config, expected: str):
-    config.add_implicit_none_return = False
-    config.keep_unused_imports = True
+def test_config_keep_trailing_docstrings(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, add_implicit_none_return=False, keep_unused_imports=True)
     config_helper(
         config,
         """
@@ -457,7 +501,7 @@ def test_config_keep_trailing_docstrings(config: Config, expected: str):
         ),
     ],
 )
-def test_config_add_implicit_none_return(config: Config, expected: str):
+def test_config_add_implicit_none_return(config_helper: ConfigHelper, config: Config, expected: str):
     config_helper(
         config,
         """
@@ -531,9 +575,8 @@ def test_config_add_implicit_none_return(config: Config, expected: str):
         ),
     ],
 )
-def test_config_flatten_if(config: Config, expected: str):
-    config.keep_unused_imports = True
-    config.keep_if_statements = True
+def test_config_flatten_if(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, keep_unused_imports=True, keep_if_statements=True)
     config_helper(
         config,
         """
@@ -576,9 +619,8 @@ def test_config_flatten_if(config: Config, expected: str):
         ),
     ],
 )
-def test_config_keep_if_statements(config: Config, expected: str):
-    config.flatten_if = False
-    config.keep_unused_imports = True
+def test_config_keep_if_statements(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, flatten_if=False, keep_unused_imports=True)
     config_helper(
         config,
         """
@@ -725,8 +767,8 @@ def test_config_keep_if_statements(config: Config, expected: str):
         ),
     ],
 )
-def test_config_add_redundant_ellipsis(config: Config, expected: str):
-    config.add_implicit_none_return = False
+def test_config_add_redundant_ellipsis(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, add_implicit_none_return=False)
     config_helper(
         config,
         """
@@ -870,7 +912,7 @@ def test_config_add_redundant_ellipsis(config: Config, expected: str):
         ),
     ],
 )
-def test_config_keep_unused_imports(config: Config, filename: str, expected: str):
+def test_config_keep_unused_imports(config_helper: ConfigHelper, config: Config, filename: str, expected: str):
     config_helper(
         config,
         """
@@ -1014,8 +1056,8 @@ def test_config_keep_unused_imports(config: Config, filename: str, expected: str
         ),
     ],
 )
-def test_config_keep_variable_value(config: Config, expected: str):
-    config.keep_definitions = True
+def test_config_keep_variable_value(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, keep_definitions=True)
     config_helper(
         config,
         """
@@ -1091,9 +1133,8 @@ def test_config_profile(config: Config, expected: str):
         ),
     ],
 )
-def test_config_format(config: Config, expected: str):
-    config.keep_definitions = True
-    config.keep_unused_imports = True
+def test_config_format(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, keep_definitions=True, keep_unused_imports=True)
     config_helper(
         config,
         """
@@ -1120,6 +1161,14 @@ for i, arg in enumerate(sys.argv[1:][3:]):
 """
 
 
+def dummy_formatter(argv: list[str]):
+    """in-process version of `DUMMY_FORMATTER`"""
+
+    major, minor, executable, *files = argv
+    for i, arg in enumerate(files):
+        Path(arg).write_text(f"{major}, {minor}, {executable}, {Path(arg).name}, #{i}")
+
+
 @pytest.mark.parametrize(
     ("config", "expected"),
     [
@@ -1177,10 +1226,35 @@ for i, arg in enumerate(sys.argv[1:][3:]):
             """,
             id="single-arg",
         ),
+        pytest.param(
+            Config(
+                python_version="3.10",
+                format=True,
+                formatter_cmds=[
+                    FormatterCmd(
+                        name="foo",
+                        cmdline=[
+                            "${dubstub_py_major}",
+                            "${dubstub_py_minor}",
+                            "${dubstub_py_exe}",
+                            "${dubstub_file_arg}",
+                        ],
+                        python_callable=dummy_formatter,
+                    )
+                ],
+            ),
+            f"""
+            # file1.pyi
+            3, 10, {sys.executable}, file1.pyi, #0
+            # file2.pyi
+            3, 10, {sys.executable}, file2.pyi, #0
+            """,
+            id="single-arg-python-callable",
+        ),
     ],
 )
-def test_config_formatter_cmds(config: Config, expected: str):
-    config.keep_definitions = True
+def test_config_formatter_cmds(config_helper: ConfigHelper, config: Config, expected: str):
+    config = replace(config, keep_definitions=True)
     config_helper(
         config,
         """
@@ -1275,7 +1349,7 @@ def test_config_python_version(config: Config, expected: tuple[int, int]):
         ),
     ],
 )
-def test_config_add_class_attributes_from_init(config: Config, expected: str):
+def test_config_add_class_attributes_from_init(config_helper: ConfigHelper, config: Config, expected: str):
     config_helper(
         config,
         """
@@ -1297,3 +1371,82 @@ def test_config_add_class_attributes_from_init(config: Config, expected: str):
         """,
         expected,
     )
+
+
+@pytest.mark.parametrize(
+    ("enabled", "expected_entries"),
+    [
+        pytest.param(True, 1, id="yes"),
+        pytest.param(False, 0, id="no"),
+    ],
+)
+def test_config_ast_cache_dir(config_helper: ConfigHelper, tmp_path: Path, enabled: bool, expected_entries: int):
+    cache_dir = tmp_path / "cache"
+    config = Config(ast_cache_dir=str(cache_dir) if enabled else "")
+
+    # the second call is served from the cache if enabled
+    for _ in range(2):
+        config_helper(
+            config,
+            """
+            import os
+            x: int = 1
+            def foo(a: os.PathLike[str]): pass
+            """,
+            """
+            import os
+            x: int = ...
+            def foo(a: os.PathLike[str]):
+                ...
+            """,
+        )
+        assert len(list(cache_dir.glob("*.pickle"))) == expected_entries
+
+
+def test_config_ast_cache_dir_unwritable(config_helper: ConfigHelper, tmp_path: Path):
+    # the cache directory can not be created below a regular file
+    (tmp_path / "file").touch()
+    config = Config(ast_cache_dir=str(tmp_path / "file" / "cache"))
+
+    # the cache is best-effort, so stubbing still works
+    config_helper(
+        config,
+        """
+        x: int = 1
+        """,
+        """
+        x: int = ...
+        """,
+    )
+    assert list(tmp_path.iterdir()) == [tmp_path / "file"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        pytest.param(b"", id="empty"),
+        pytest.param(b"garbage", id="garbage"),
+        pytest.param(pickle.dumps(ast.parse("x: int = 1"))[:20], id="truncated"),
+        pytest.param(b"cast\nNoSuchNode\n.", id="missing-class"),
+        pytest.param(pickle.dumps(42), id="wrong-type"),
+    ],
+)
+def test_config_ast_cache_dir_corrupted(config_helper: ConfigHelper, tmp_path: Path, content: bytes):
+    cache_dir = tmp_path / "cache"
+    config = Config(ast_cache_dir=str(cache_dir))
+
+    for _ in range(2):
+        config_helper(
+            config,
+            """
+            x: int = 1
+            """,
+            """
+            x: int = ...
+            """,
+        )
+
+        # corrupted entries count as a miss, and get replaced with a valid one
+        (entry,) = cache_dir.glob("*.pickle")
+        assert isinstance(pickle.loads(entry.read_bytes()), ast.Module)
+        entry.write_bytes(content)
@@ -1,8 +1,11 @@
+import os
+import subprocess
 from pathlib import Path
 
 import pytest
 
-from dubstub.evaluate.gen_mypy import find_mypy_out_subdir
+from dubstub.evaluate import gen_mypy
+from dubstub.evaluate.gen_mypy import MYPY_CACHE_ENV, find_mypy_out_subdir, run_mypy, run_mypy_cached
 
 INPUT1 = [
     # namespace package
@@ -18,13 +21,22 @@ INPUT1 = [
 ]
 
 
-def make_dir_entry(dst: Path, rel: str):
-    cur = dst / rel
-    if cur.suffix:
-        cur.parent.mkdir(parents=True, exist_ok=True)
-        cur.touch()
-    else:
-        cur.mkdir(parents=True, exist_ok=True)
+def make_dir_entries(dst: Path, rels: list[str]):
+    dirs: set[Path] = set()
+    files: list[Path] = []
+    for rel in rels:
+        cur = dst / rel
+        if cur.suffix:
+            dirs.add(cur.parent)
+            files.append(cur)
+        else:
+            dirs.add(cur)
+
+    # NB: Shared parent directories only get created once
+    for directory in sorted(dirs, key=lambda d: len(d.parts)):
+        directory.mkdir(parents=True, exist_ok=True)
+    for file in files:
+        file.touch()
 
 
 @pytest.mark.parametrize(
@@ -135,14 +147,115 @@ def test_find_output(tmp_path: Path, inp: list[str], arg: str, mypy_out: list[st
     inp_path.mkdir()
     out_path.mkdir()
 
-    for single_inp in inp:
-        make_dir_entry(inp_path, single_inp)
-
-    for single_mypy_out in mypy_out:
-        make_dir_entry(out_path, single_mypy_out)
+    make_dir_entries(inp_path, inp)
+    make_dir_entries(out_path, mypy_out)
 
     # subprocess.run(["tree", "-a", str(tmp_path)])
 
     arg_path = inp_path / arg
     found = find_mypy_out_subdir(arg_path, out_path)
     assert str(found) == expected_found
+
+
+def test_mypy_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache_path = tmp_path / "cache"
+    inp_path = tmp_path / "inp"
+    inp_path.mkdir()
+    (inp_path / "foo.py").write_text("def foo(x: int) -> int:\n    return x\n")
+
+    monkeypatch.setenv(MYPY_CACHE_ENV, str(cache_path))
+
+    def run(name: str) -> dict[str, str]:
+        out_path = tmp_path / name
+        out_path.mkdir()
+        run_mypy_cached(tmp_path, inp_path / "foo.py", out_path)
+        return {str(path.relative_to(out_path)): path.read_text() for path in out_path.rglob("*.pyi")}
+
+    first = run("out1")
+    assert len(list(cache_path.iterdir())) == 1
+
+    # a cache hit must not invoke mypy again
+    def fail(*_: object):
+        raise AssertionError("mypy should not have been called")
+
+    with monkeypatch.context() as ctx:
+        ctx.setattr(gen_mypy, "run_mypy", fail)
+        assert run("out2") == first
+
+    # changing the input invalidates the cache entry
+    (inp_path / "foo.py").write_text("def bar() -> None: ...\n")
+    third = run("out3")
+    assert third != first
+    assert len(list(cache_path.iterdir())) == 2
+
+    # editing a parent `__init__` invalidates the cache entry as well
+    (inp_path / "__init__.py").write_text("")
+    run("out4")
+    (inp_path / "__init__.py").write_text("from .foo import bar\n")
+    run("out5")
+    assert len(list(cache_path.iterdir())) == 4
+
+
+def test_mypy_cache_eviction_skips_staging(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache_path = tmp_path / "cache"
+    inp_path = tmp_path / "inp"
+    inp_path.mkdir()
+    (inp_path / "foo.py").write_text("x = 1\n")
+
+    # an in-progress entry of a concurrent run
+    staging = cache_path / "0123.4567.tmp"
+    staging.mkdir(parents=True)
+    (staging / "foo.pyi").write_text("x: int\n")
+
+    def fake_run_mypy(_tmp: Path, _dir_or_file: Path, out_dir: Path):
+        (out_dir / "foo.pyi").write_text("x: int\n")
+
+    monkeypatch.setenv(MYPY_CACHE_ENV, str(cache_path))
+    monkeypatch.setattr(gen_mypy, "run_mypy", fake_run_mypy)
+    monkeypatch.setattr(gen_mypy, "MYPY_CACHE_MAX_BYTES", 0)
+
+    out_path = tmp_path / "out"
+    out_path.mkdir()
+    run_mypy_cached(tmp_path, inp_path / "foo.py", out_path)
+
+    # everything but the staging directory got evicted
+    assert list(cache_path.iterdir()) == [staging]
+
+
+def test_mypy_cache_eviction_uses_recorded_size(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache_path = tmp_path / "cache"
+    inp_path = tmp_path / "inp"
+    inp_path.mkdir()
+    (inp_path / "foo.py").write_text("x = 1\n")
+
+    # an older entry that is small on disk, but whose recorded size is above the limit
+    old_entry = cache_path / "0123"
+    (old_entry / "out").mkdir(parents=True)
+    (old_entry / "size").write_text("1000")
+    os.utime(old_entry, ns=(0, 0))
+
+    def fake_run_mypy(_tmp: Path, _dir_or_file: Path, out_dir: Path):
+        (out_dir / "foo.pyi").write_text("x: int\n")
+
+    monkeypatch.setenv(MYPY_CACHE_ENV, str(cache_path))
+    monkeypatch.setattr(gen_mypy, "run_mypy", fake_run_mypy)
+    monkeypatch.setattr(gen_mypy, "MYPY_CACHE_MAX_BYTES", 100)
+
+    out_path = tmp_path / "out"
+    out_path.mkdir()
+    run_mypy_cached(tmp_path, inp_path / "foo.py", out_path)
+
+    # only the old entry got evicted, and the new one recorded its own size
+    (new_entry,) = cache_path.iterdir()
+    assert new_entry != old_entry
+    assert (new_entry / "size").read_text() == str(len("x: int\n"))
+
+
+def test_mypy_error(tmp_path: Path):
+    (tmp_path / "broken.py").write_text("def foo(:\n")
+    out_path = tmp_path / "out"
+    out_path.mkdir()
+
+    # invalid input must raise, and not exit the process
+    with pytest.raises(subprocess.CalledProcessError):
+        run_mypy(tmp_path, tmp_path / "broken.py", out_path)
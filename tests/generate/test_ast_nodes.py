@@ -1,13 +1,18 @@
 import ast
+import io
+import os
 import shutil
 import subprocess
 import sys
-from dataclasses import dataclass
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
 from pathlib import Path
 from textwrap import dedent, indent
 
 import pytest
 
+from dubstub import main
+
 from .. import TESTDATA
 
 
@@ -16,6 +21,19 @@ class Case:
     ast_type: type[ast.AST]
     raw: str
     special: str | None = None
+    # Whether to also run the case through the interpreter and stubber. Disabled for cases
+    # that only differ from another case by their operator, as the stubber treats them the same.
+    exec_: bool = True
+
+    # derived from `raw` once, instead of in every test run
+    dedented: str = field(init=False)
+    indented4: str = field(init=False)
+    indented8: str = field(init=False)
+
+    def __post_init__(self):
+        self.dedented = dedent(self.raw)
+        self.indented4 = indent(self.dedented, "    ")
+        self.indented8 = indent(self.dedented, "        ")
 
 
 EXPRESSIONS: list[Case] = [
@@ -37,37 +55,37 @@ EXPRESSIONS: list[Case] = [
     Case(ast.Starred, r"*value_list", special="ignore"),  # covered by assignment case
     #
     Case(ast.UnaryOp, r"not value_bool"),
-    Case(ast.UnaryOp, r"+value_int"),
-    Case(ast.UnaryOp, r"-value_int"),
-    Case(ast.UnaryOp, r"~value_int"),
+    Case(ast.UnaryOp, r"+value_int", exec_=False),
+    Case(ast.UnaryOp, r"-value_int", exec_=False),
+    Case(ast.UnaryOp, r"~value_int", exec_=False),
     #
     Case(ast.BinOp, r"value_int + value_int"),
-    Case(ast.BinOp, r"value_int - value_int"),
-    Case(ast.BinOp, r"value_int * value_int"),
-    Case(ast.BinOp, r"value_int / value_int"),
-    Case(ast.BinOp, r"value_int // value_int"),
-    Case(ast.BinOp, r"value_int % value_int"),
-    Case(ast.BinOp, r"value_int ** value_int"),
-    Case(ast.BinOp, r"value_int << value_int"),
-    Case(ast.BinOp, r"value_int >> value_int"),
-    Case(ast.BinOp, r"value_int | value_int"),
-    Case(ast.BinOp, r"value_int & value_int"),
-    Case(ast.BinOp, r"value_int ^ value_int"),
+    Case(ast.BinOp, r"value_int - value_int", exec_=False),
+    Case(ast.BinOp, r"value_int * value_int", exec_=False),
+    Case(ast.BinOp, r"value_int / value_int", exec_=False),
+    Case(ast.BinOp, r"value_int // value_int", exec_=False),
+    Case(ast.BinOp, r"value_int % value_int", exec_=False),
+    Case(ast.BinOp, r"value_int ** value_int", exec_=False),
+    Case(ast.BinOp, r"value_int << value_int", exec_=False),
+    Case(ast.BinOp, r"value_int >> value_int", exec_=False),
+    Case(ast.BinOp, r"value_int | value_int", exec_=False),
+    Case(ast.BinOp, r"value_int & value_int", exec_=False),
+    Case(ast.BinOp, r"value_int ^ value_int", exec_=False),
     Case(ast.BinOp, r"value_int @ value_int", special="ignore"),  # too obscure
     #
     Case(ast.BoolOp, r"value_bool and value_bool"),
     Case(ast.BoolOp, r"value_bool or value_bool"),
     #
     Case(ast.Compare, r"value_int == value_int"),
-    Case(ast.Compare, r"value_int != value_int"),
-    Case(ast.Compare, r"value_int < value_int"),
-    Case(ast.Compare, r"value_int <= value_int"),
-    Case(ast.Compare, r"value_int > value_int"),
-    Case(ast.Compare, r"value_int >= value_int"),
-    Case(ast.Compare, r"value_int is value_int"),
-    Case(ast.Compare, r"value_int is not value_int"),
-    Case(ast.Compare, r"value_int in value_list"),
-    Case(ast.Compare, r"value_int not in value_list"),
+    Case(ast.Compare, r"value_int != value_int", exec_=False),
+    Case(ast.Compare, r"value_int < value_int", exec_=False),
+    Case(ast.Compare, r"value_int <= value_int", exec_=False),
+    Case(ast.Compare, r"value_int > value_int", exec_=False),
+    Case(ast.Compare, r"value_int >= value_int", exec_=False),
+    Case(ast.Compare, r"value_int is value_int", exec_=False),
+    Case(ast.Compare, r"value_int is not value_int", exec_=False),
+    Case(ast.Compare, r"value_int in value_list", exec_=False),
+    Case(ast.Compare, r"value_int not in value_list", exec_=False),
     #
     Case(ast.Call, r"func(value_int)"),
     Case(ast.Call, r"klass.func(value_int)"),
@@ -110,18 +128,6 @@ EXPRESSIONS: list[Case] = [
 # r"del x[y]"
 
 
-@pytest.mark.parametrize("case", EXPRESSIONS)
-def test_expression(case: Case):
-    module = ast.parse(case.raw)
-    assert len(module.body) == 1
-    stmt = module.body[0]
-
-    assert isinstance(stmt, ast.Expr)
-    value = stmt.value
-
-    assert isinstance(value, case.ast_type)
-
-
 STATEMENTS: list[Case] = [
     Case(ast.Assign, r"x = value_int"),
     Case(ast.Assign, r"x = y = value_int"),
@@ -412,28 +418,58 @@ STATEMENTS: list[Case] = [
 ]
 
 
-@pytest.mark.parametrize("case", STATEMENTS)
-def test_statement(case: Case):
+@pytest.mark.parametrize(
+    ("kind", "case"),
+    [pytest.param("expr", case, id=f"expr:{case.raw}") for case in EXPRESSIONS]
+    + [pytest.param("stmt", case, id=f"stmt:{case.raw}") for case in STATEMENTS],
+)
+def test_ast_type(kind: str, case: Case):
     module = ast.parse(case.raw)
     assert len(module.body) == 1
-    stmt = module.body[0]
+    node = module.body[0]
+
+    if kind == "expr":
+        assert isinstance(node, ast.Expr)
+        node = node.value
+
+    assert isinstance(node, case.ast_type)
 
-    assert isinstance(stmt, case.ast_type)
 
+# the content of the template file that each test case appends its code to
+TEMPLATE_SRC = (TESTDATA / "ast_template" / "file.py").read_text() + "\n"
 
-@pytest.mark.parametrize("case", [pytest.param(case, id=case.raw) for case in EXPRESSIONS + STATEMENTS])
-def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argument
+
+@pytest.fixture(name="ast_template", scope="session")
+def fixture_ast_template(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """
+    A private copy of the `ast_template` test data, shared by all test cases of a session.
+
+    The test cases hard link its files, so the original test data can never get modified through a link.
+    """
+
+    template = tmp_path_factory.mktemp("ast_template") / "ast_template"
+    shutil.copytree(TESTDATA / "ast_template", template)
+    return template
+
+
+def link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+@pytest.mark.parametrize("case", [case for case in EXPRESSIONS + STATEMENTS if case.exec_], ids=lambda case: case.raw)
+def test_executable(case: Case, ast_template: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
     root_path = tmp_path / "generated"
 
-    shutil.copytree(TESTDATA / "ast_template", root_path)
+    shutil.copytree(ast_template, root_path, copy_function=link_or_copy)
     file_path = root_path / "file.py"
     out_path = tmp_path / "output"
 
-    assert file_path.exists()
-
-    content = file_path.read_text() + "\n"
+    content = TEMPLATE_SRC
     as_module = False
-    raw = dedent(case.raw)
+    raw = case.dedented
 
     if case.special == "func_body":
         content += dedent(
@@ -441,7 +477,7 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
             def foo():
             {}
             """
-        ).format(indent(raw, "    "))
+        ).format(case.indented4)
     elif case.special == "nested_func_body":
         content += dedent(
             """
@@ -451,14 +487,14 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
                 def bar():
             {}
             """
-        ).format(indent(raw, "        "))
+        ).format(case.indented8)
     elif case.special == "async_func_body":
         content += dedent(
             """
             async def foo():
             {}
             """
-        ).format(indent(raw, "    "))
+        ).format(case.indented4)
     elif case.special == "raise":
         content += dedent(
             """
@@ -467,7 +503,7 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
             except:
                 import mod_a
             """
-        ).format(indent(raw, "    "))
+        ).format(case.indented4)
     elif case.special == "loop":
         content += dedent(
             """
@@ -475,7 +511,7 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
                 import mod_a
             {}
             """
-        ).format(indent(raw, "    "))
+        ).format(case.indented4)
     elif case.special == "as_module":
         as_module = True
         content += f"{raw}\n"
@@ -488,6 +524,8 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
     print(content)
     print("----------------------------------")
 
+    # NB: Break the hard link to the template first, so that only this test case sees the change
+    file_path.unlink()
     file_path.write_text(content)
 
     print(case.ast_type)
@@ -504,22 +542,12 @@ def test_executable(case: Case, tmp_path: Path):  # pylint: disable=unused-argum
             check=True,
         )
 
-    out = subprocess.run(
-        [
-            sys.executable,
-            "-c",
-            "from dubstub import main; main()",
-            "gen",
-            "--input",
-            str(root_path),
-            "--output",
-            str(out_path),
-        ],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        encoding="utf-8",
-    )
-
-    lines = [line for line in out.stdout.splitlines() if line.strip()]
-    assert all(any(l.startswith(prefix) for prefix in ("Clean", "Stub")) for l in lines), "\n" + out.stdout
+    # NB: The generated code has to run in its own interpreter, as every test case
+    # imports its own modules under the same names. The generator itself can just run in-process.
+    out = io.StringIO()
+    with monkeypatch.context() as ctx, redirect_stdout(out), redirect_stderr(out):
+        ctx.setattr(sys, "argv", ["dubstub", "gen", "--input", str(root_path), "--output", str(out_path)])
+        main()
+
+    lines = [line for line in out.getvalue().splitlines() if line.strip()]
+    assert all(any(l.startswith(prefix) for prefix in ("Clean", "Stub")) for l in lines), "\n" + out.getvalue()
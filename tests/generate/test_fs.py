@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import pytest
+
+from dubstub import generate_stubs, generate_stubs_source
+from dubstub.config import Config, FormatterCmd
+
+SOURCE = '''
+"""module docstring"""
+import os
+from typing import TypeVar
+
+T = TypeVar("T")
+x: int = 1
+_y = 2
+
+def foo(a: os.PathLike[str]) -> None:
+    """foo docstring"""
+    print(a)
+
+class Bar:
+    def __init__(self):
+        self.z: int = 3
+
+    def _baz(self):
+        pass
+'''
+
+
+@pytest.mark.parametrize(
+    ("config", "relative_path"),
+    [
+        pytest.param(Config(), Path("file.py"), id="default"),
+        pytest.param(Config(profile="no_privacy"), Path("file.py"), id="no_privacy"),
+        pytest.param(Config(keep_definitions="name_is('_y')"), Path("file.py"), id="keep_definitions"),
+        pytest.param(Config(), Path("_private.py"), id="private-module"),
+        pytest.param(Config(), Path("pkg") / "__init__.py", id="package"),
+    ],
+)
+def test_generate_stubs_source(tmp_path: Path, config: Config, relative_path: Path):
+    inp_path = tmp_path / "input" / relative_path
+    inp_path.parent.mkdir(parents=True)
+    inp_path.write_text(SOURCE)
+    out_path = tmp_path / "output"
+
+    generate_stubs(tmp_path / "input", out_path, config)
+
+    expected = (out_path / relative_path).with_suffix(".pyi").read_text()
+    assert generate_stubs_source(SOURCE, config, relative_path) == expected
+
+
+def test_generate_stubs_source_never_formats():
+    def formatter(cmdline: list[str]):
+        raise AssertionError(f"formatter called with {cmdline}")
+
+    config = Config(
+        format=True,
+        formatter_cmds=[FormatterCmd("fail", ["${dubstub_file_arg}"], python_callable=formatter)],
+    )
+    assert generate_stubs_source(SOURCE, config) == generate_stubs_source(SOURCE, Config(format=False))
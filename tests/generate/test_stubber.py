@@ -1,5 +1,6 @@
 import ast
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 import pytest
@@ -10,6 +11,8 @@ from dubstub.source import AstConfig, Source
 
 from .. import TESTDATA
 
+AST_CONFIG = AstConfig()
+
 TEST_CONFIG = Config(
     # Default profile, with justified exceptions
     keep_unused_imports=True,  # don't remove imports
@@ -18,38 +21,41 @@ TEST_CONFIG = Config(
 ).validate()
 
 
-@pytest.mark.parametrize(
-    "module",
-    [pytest.param(mod, id=mod.stem) for mod in (TESTDATA / "modules").glob("*.py")],
-)
-def test_stubs(module: Path):
-    module_content = module.read_text()
-    expected_content = module.with_suffix(".pyi").read_text().rstrip() + "\n"
+# Maps the name of each test module to its source and its expected stub
+MODULES: dict[str, tuple[str, str]] = {
+    mod.stem: (mod.read_text(), mod.with_suffix(".pyi").read_text().rstrip() + "\n")
+    for mod in sorted((TESTDATA / "modules").glob("*.py"))
+}
+
 
-    if module.stem == "py312" and sys.version_info < (3, 12):
+def skip_unsupported_module(name: str):
+    if name == "py312" and sys.version_info < (3, 12):
         pytest.skip()
-    if module.stem == "py313" and sys.version_info < (3, 13):
+    if name == "py313" and sys.version_info < (3, 13):
         pytest.skip()
 
-    stubbed = stubgen_single_file_src(module_content, Path(module.name), TEST_CONFIG)
 
-    assert stubbed == expected_content
+@lru_cache(maxsize=None)
+def stub_module(name: str) -> str:
+    # NB: Cached, as both `test_stubs` and `test_idempotence` need the stubbed module
+    module_content, _ = MODULES[name]
+    return stubgen_single_file_src(module_content, Path(f"{name}.py"), TEST_CONFIG)
 
 
-@pytest.mark.parametrize(
-    "module",
-    [pytest.param(mod, id=mod.stem) for mod in (TESTDATA / "modules").glob("*.py")],
-)
-def test_idempotence(module: Path):
-    module_content = module.read_text()
+@pytest.mark.parametrize("name", list(MODULES))
+def test_stubs(name: str):
+    skip_unsupported_module(name)
+    _, expected_content = MODULES[name]
 
-    if module.stem == "py312" and sys.version_info < (3, 12):
-        pytest.skip()
-    if module.stem == "py313" and sys.version_info < (3, 13):
-        pytest.skip()
+    assert stub_module(name) == expected_content
 
-    stubbed = stubgen_single_file_src(module_content, Path(module.name), TEST_CONFIG)
-    restubbed = stubgen_single_file_src(stubbed, Path(module.name), TEST_CONFIG)
+
+@pytest.mark.parametrize("name", list(MODULES))
+def test_idempotence(name: str):
+    skip_unsupported_module(name)
+
+    stubbed = stub_module(name)
+    restubbed = stubgen_single_file_src(stubbed, Path(f"{name}.py"), TEST_CONFIG)
 
     assert stubbed == restubbed
 
@@ -109,55 +115,60 @@ def test_discover_names():
     }
 
 
-@pytest.mark.parametrize(
-    ("import_src", "expected"),
-    [
-        ("import X as X", True),
-        ("import X as Y", False),
-        ("import a.b.c.X as X", False),
-        ("from a.b.c import X as X", True),
-        ("from a.b.c import *", True),
-    ],
-)
-def test_is_rexport(import_src: str, expected: bool):
-    source = Source(import_src, Path("file.py"), AstConfig())
+IS_REEXPORT_CASES = [
+    ("import X as X", True),
+    ("import X as Y", False),
+    ("import a.b.c.X as X", False),
+    ("from a.b.c import X as X", True),
+    ("from a.b.c import *", True),
+]
+
+IMPORTED_NAME_CASES = [
+    ("import X as X", "X"),
+    ("import X as Y", "Y"),
+    ("import a.b.c.X as X", "X"),
+    ("import a.b.c.X", "a"),
+    ("import X", "X"),
+    #
+    ("from a.b.c import X as X", "X"),
+    ("from a.b.c import *", "*"),
+    ("from .foo.bar import X", "X"),
+    ("from . import X", "X"),
+    ("from .... import X", "X"),
+]
+
+
+def parse_single_imports(import_srcs: list[str]) -> dict[str, ast.alias]:
+    """
+    Parses all single-name import statements at once, as a single source with one import per line.
+    """
+
+    source = Source("\n".join(import_srcs), Path("file.py"), AST_CONFIG)
     ast_module = source.parse_module()
+    assert len(ast_module.body) == len(import_srcs)
 
-    stmt = ast_module.body[0]
-    assert isinstance(stmt, ast.Import | ast.ImportFrom)
+    ret: dict[str, ast.alias] = {}
+    for import_src, stmt in zip(import_srcs, ast_module.body):
+        assert isinstance(stmt, ast.Import | ast.ImportFrom)
+        assert len(stmt.names) == 1
+        ret[import_src] = stmt.names[0]
+    return ret
 
-    assert len(stmt.names) == 1
-    name = stmt.names[0]
+
+IMPORTS = parse_single_imports(list(dict.fromkeys(src for src, _ in IS_REEXPORT_CASES + IMPORTED_NAME_CASES)))
+
+
+@pytest.mark.parametrize(("import_src", "expected"), IS_REEXPORT_CASES)
+def test_is_rexport(import_src: str, expected: bool):
+    name = IMPORTS[import_src]
 
     result = Stubber.import_is_export(name)
     assert result == expected, f"expected {expected} for `{import_src}`"
 
 
-@pytest.mark.parametrize(
-    ("import_src", "expected"),
-    [
-        ("import X as X", "X"),
-        ("import X as Y", "Y"),
-        ("import a.b.c.X as X", "X"),
-        ("import a.b.c.X", "a"),
-        ("import X", "X"),
-        #
-        ("from a.b.c import X as X", "X"),
-        ("from a.b.c import *", "*"),
-        ("from .foo.bar import X", "X"),
-        ("from . import X", "X"),
-        ("from .... import X", "X"),
-    ],
-)
+@pytest.mark.parametrize(("import_src", "expected"), IMPORTED_NAME_CASES)
 def test_get_importesd_name(import_src: str, expected: bool):
-    source = Source(import_src, Path("file.py"), AstConfig())
-    ast_module = source.parse_module()
-
-    stmt = ast_module.body[0]
-    assert isinstance(stmt, ast.Import | ast.ImportFrom)
-
-    assert len(stmt.names) == 1
-    name = stmt.names[0]
+    name = IMPORTS[import_src]
 
     result = Stubber.get_imported_name(name)
     assert result == expected, f"expected `{import_src}` to import `{expected}`"
@@ -1,3 +1,5 @@
+import os
+from operator import itemgetter
 from pathlib import Path
 
 import pytest
@@ -5,6 +7,18 @@ import pytest
 from dubstub.fs import Kind, Walker, find_module_roots
 
 
+def materialize_files(base: Path, files: list[str]):
+    file_paths = [base / file for file in files]
+
+    # NB: Shared parent directories only get created once
+    for directory in sorted({file_path.parent for file_path in file_paths}, key=lambda d: len(d.parts)):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    # the tests only need the files to exist, so skip the timestamp update of `Path.touch()`
+    for file_path in file_paths:
+        os.close(os.open(file_path, os.O_CREAT | os.O_WRONLY, 0o644))
+
+
 @pytest.mark.parametrize(
     ("files", "inp", "out", "expected_visited"),
     [
@@ -128,10 +142,7 @@ def test_walker(tmp_path: Path, files: list[str], inp: str, out: str, expected_v
     inp_base.mkdir()
     out_base.mkdir()
 
-    for file in files:
-        file_path = inp_base / file
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.touch()
+    materialize_files(inp_base, files)
 
     inp_root = inp_base / inp
     out_root = out_base / out
@@ -141,9 +152,9 @@ def test_walker(tmp_path: Path, files: list[str], inp: str, out: str, expected_v
     expected: list[dict[str, str]] = [
         {
             ".kind": kind,
-            "inp_rel": str(Path(rel) / i),
+            "inp_rel": os.path.normpath(os.path.join(rel, i)),
             "inp_pat": i,
-            "out_rel": str(Path(rel) / o),
+            "out_rel": os.path.normpath(os.path.join(rel, o)),
             "out_pat": o,
         }
         for kind, rel, i, o in expected_visited
@@ -155,15 +166,16 @@ def test_walker(tmp_path: Path, files: list[str], inp: str, out: str, expected_v
         visited.append(
             {
                 ".kind": kind,
-                "inp_rel": str(event.inp_path.relative_to(inp_base)),
+                "inp_rel": os.path.relpath(event.inp_path, inp_base),
                 "inp_pat": event.inp_rel_pattern,
-                "out_rel": str(event.out_path.relative_to(out_base)),
+                "out_rel": os.path.relpath(event.out_path, out_base),
                 "out_pat": event.out_rel_pattern,
             }
         )
 
-    expected.sort(key=lambda e: (e["inp_rel"], e[".kind"]))
-    visited.sort(key=lambda e: (e["inp_rel"], e[".kind"]))
+    sort_key = itemgetter("inp_rel", ".kind")
+    expected.sort(key=sort_key)
+    visited.sort(key=sort_key)
 
     assert expected == visited
 
@@ -231,10 +243,7 @@ def test_walker(tmp_path: Path, files: list[str], inp: str, out: str, expected_v
 def test_find_module_roots(tmp_path: Path, files: list[str], inp: str, expected_visited: list[str]):
     inp_base = tmp_path / "input"
 
-    for file in files:
-        file_path = inp_base / file
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.touch()
+    materialize_files(inp_base, files)
 
     visited: set[str] = set()
     for root in find_module_roots(inp_base / inp):
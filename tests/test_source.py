@@ -45,8 +45,11 @@ hello world
 ]
 
 
+AST_CONFIG = AstConfig()
+
+
 def test_source():
-    source = Source(SOURCE, Path("file.py"), AstConfig())
+    source = Source(SOURCE, Path("file.py"), AST_CONFIG)
     module = source.parse_module()
 
     stmts: list[str] = []
@@ -58,5 +61,5 @@ def test_source():
 
 
 def test_parse_expr():
-    source = Source(SOURCE, Path("file.py"), AstConfig())
+    source = Source(SOURCE, Path("file.py"), AST_CONFIG)
     source.parse_expr("42 < 14 and True != False")
@@ -1,3 +1,8 @@
+from typing import Any
+
+from hypothesis import given
+from hypothesis import strategies as st
+
 from dubstub import toml
 
 DATA = {
@@ -31,3 +36,23 @@ def test_dumps():
 
 def test_loads():
     assert toml.loads(TOML) == DATA
+
+
+TOML_KEYS = st.text(st.characters(whitelist_categories=("Ll", "Lu", "Nd")), min_size=1)
+TOML_SCALARS = st.one_of(
+    st.booleans(),
+    st.integers(min_value=-(2**63), max_value=2**63 - 1),
+    st.text(st.characters(blacklist_categories=("Cs",))),
+)
+TOML_VALUES = st.recursive(
+    TOML_SCALARS,
+    lambda children: st.one_of(
+        st.lists(children, max_size=4),
+        st.dictionaries(TOML_KEYS, children, max_size=4),
+    ),
+)
+
+
+@given(st.dictionaries(TOML_KEYS, TOML_VALUES, max_size=4))
+def test_roundtrip(data: dict[str, Any]):
+    assert toml.loads(toml.dumps(data)) == data